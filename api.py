@@ -1,27 +1,303 @@
-from fastapi import FastAPI, HTTPException
+import time
+# Cold-start accounting starts before the heavy imports below
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, Response, FileResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import os
 import sys
+import threading
+import uuid
 
 # Add current directory to path so we can import scraper
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from stream_scraper.scraper import scrape_stream_app_mode
+from stream_scraper.scraper import get_browser_pool, refresh_session, warm_browser
+from stream_scraper.session import get_session_store
+from stream_scraper.fleet import get_worker_fleet
+from stream_scraper.resolver import resolve_stream
+from stream_scraper.jobs import JobScheduler, Saturated
+from stream_scraper.cache import ResultCache, normalize_url
+from stream_scraper.catalog import fetch_episodes
+from stream_scraper.download import DownloadManager
+from stream_scraper import hls, http_client, mirrors, relay
+from stream_scraper.relay import SegmentCache
+from stream_scraper import metrics
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
+# Opt-in per request via ?prefetch=...; PREFETCH_ENABLED=0 turns it off server-wide
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "1") != "0"
+PREFETCH_MAX = int(os.environ.get("PREFETCH_MAX", "2"))
+# Public base URL for relay links when behind a proxy (defaults to the request's base URL)
+RELAY_PUBLIC_URL = os.environ.get("RELAY_PUBLIC_URL", "").rstrip("/")
+# Without a pool or fleet, SCRAPER_WARMUP=1 launches (and closes) one browser at boot
+WARMUP = os.environ.get("SCRAPER_WARMUP", "0") != "0"
+
+scheduler = JobScheduler(resolve_stream)
+cache = ResultCache()
+segment_cache = SegmentCache()
+downloads = DownloadManager(lambda url: resolve_cached(url))
+_segment_fetches = {}
+_revalidating = set()
+# Strong references so fire-and-forget tasks are not garbage collected mid-run
+_background_tasks = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def resolve_and_cache(url, background=False):
+    """Resolves through the scheduler (single-flight per normalized URL) and caches successes."""
+    url = mirrors.rewrite(url)
+    key = normalize_url(url)
+    result = await scheduler.submit(key, url, background=background)
+    if result and "error" not in result:
+        cache.set(key, result)
+    return result
+
+async def _revalidate(url):
+    key = normalize_url(url)
+    try:
+        await resolve_and_cache(url)
+    except Exception as e:
+        print(f"Background revalidation failed for {url}: {e}")
+    finally:
+        _revalidating.discard(key)
+
+async def resolve_cached(url):
+    """
+    Cache-first resolution. Fresh hits return immediately, stale hits return
+    immediately and trigger one background refresh, misses resolve inline.
+    Episode links on an old domain are moved onto the current mirror first.
+    """
+    url = mirrors.rewrite(url)
+    key = normalize_url(url)
+    cached = cache.get(key)
+    if cached:
+        result, state = cached
+        if state == "stale" and key not in _revalidating:
+            _revalidating.add(key)
+            _spawn(_revalidate(url))
+        return dict(result, cache=state)
+    result = await resolve_and_cache(url)
+    if result and "error" not in result:
+        result = dict(result, cache="miss")
+    return result
+
+async def _season_episodes(season_url):
+    """Episode links of a season page, failing over to the next mirror if the current one is down."""
+    try:
+        episodes = await asyncio.to_thread(
+            mirrors.fetch_on_mirror, mirrors.rewrite(season_url), lambda url: fetch_episodes(url, strict=True)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Could not load season page: {e}")
+    return [mirrors.rewrite(ep["link"]) for ep in episodes]
+
+def _browser_backend():
+    """(fleet, pool): browsers live either in worker processes or in this process."""
+    fleet = get_worker_fleet()
+    return fleet, None if fleet else get_browser_pool()
+
+# Seconds measured during cold start; None until the phase happened
+startup = {"import_seconds": round(IMPORT_SECONDS, 3), "warmup_seconds": None,
+           "ready_seconds": None, "first_scrape_seconds": None}
+_ready = threading.Event()
+
+def _mark_ready():
+    if not _ready.is_set():
+        startup["ready_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+        _ready.set()
+        print(f"Ready after {startup['ready_seconds']}s (imports {startup['import_seconds']}s)")
+
+def _warm_up(backend):
+    """Starts the pool/fleet, or launches one throwaway browser, then marks the service ready."""
+    started = time.perf_counter()
+    try:
+        if backend:
+            backend.start()
+        else:
+            warm_browser()
+        startup["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        # The HTTP tier still works; a failed warm-up must not keep the instance out of rotation
+        print(f"Warm-up failed: {e}")
+    finally:
+        _mark_ready()
 
-app = FastAPI()
+def is_ready():
+    """Ready once warm-up finished, or as soon as one pooled browser is idle."""
+    if not _ready.is_set():
+        fleet, pool = _browser_backend()
+        backend = fleet or pool
+        if backend and backend.stats()["idle"] > 0:
+            _mark_ready()
+    return _ready.is_set()
+
+def _refresh_session_job(url, cancel=None):
+    # Scheduler worker for session refreshes: one short page load, not worth preempting
+    fleet = get_worker_fleet()
+    return fleet.refresh_session(url) if fleet else refresh_session(url)
+
+def _session_refresher(loop):
+    """
+    refresh() for the session refresher thread: runs each refresh as a
+    background scheduler job, so it only takes a spare slot and browser.
+    """
+    def refresh(url):
+        job = scheduler.submit(f"session:{url}", url, background=True, worker=_refresh_session_job)
+        try:
+            return asyncio.run_coroutine_threadsafe(job, loop).result()
+        except Saturated:
+            return None
+    return refresh
+
+@asynccontextmanager
+async def lifespan(app):
+    fleet, pool = _browser_backend()
+    backend = fleet or pool
+    mirrors.get_mirror_resolver().start_background()
+    store = get_session_store()
+    if store:
+        # Renew clearance cookies in a browser before they lapse
+        store.start_refresher(_session_refresher(asyncio.get_running_loop()))
+    if backend or WARMUP:
+        # Warm browsers in the background so the server starts accepting requests immediately
+        threading.Thread(target=_warm_up, args=(backend,), name="warm-up", daemon=True).start()
+    else:
+        _mark_ready()
+    yield
+    if backend:
+        backend.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+REQUESTS = metrics.Counter("api_requests_total", "HTTP requests by route and status.", ["route", "status"])
+REQUEST_SECONDS = metrics.Histogram("api_request_seconds", "HTTP request latency by route.", ["route"])
+STATE = metrics.Gauge("api_component_state", "Pool, job, cache and relay counters.", ["component", "field"])
+STARTUP = metrics.Gauge("api_startup_seconds", "Cold-start timings: imports, warm-up, ready, first scrape.", ["phase"])
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Assigns a request ID (or keeps the caller's X-Request-ID) and records latency."""
+    rid = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+    token = metrics.request_id.set(rid)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = rid
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route else "unmatched"
+        if path == "/scrape" and startup["first_scrape_seconds"] is None:
+            startup["first_scrape_seconds"] = round(time.perf_counter() - started, 3)
+        REQUESTS.inc(route=path, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=path)
+        metrics.log_event("request", method=request.method, route=path, status=status,
+                          seconds=round(time.perf_counter() - started, 4))
+        metrics.request_id.reset(token)
 
 class ScrapeRequest(BaseModel):
     url: str
 
+class BatchRequest(BaseModel):
+    season_url: Optional[str] = None
+    urls: Optional[List[str]] = None
+    format: str = "ndjson"  # "ndjson" or "sse"
+
+class DownloadRequest(BaseModel):
+    url: Optional[str] = None          # episode page
+    season_url: Optional[str] = None   # every episode of a season
+    master_url: Optional[str] = None   # an already resolved playlist
+    referer: Optional[str] = None
+    user_agent: Optional[str] = None
+    quality: Optional[str] = None      # variant height, e.g. "720"; best when omitted
+
+async def _prefetch_one(url):
+    try:
+        result = await resolve_and_cache(url, background=True)
+        if result and "error" not in result:
+            print(f"Prefetched: {url}")
+    except Saturated:
+        print(f"Prefetch skipped (no spare capacity): {url}")
+    except Exception as e:
+        print(f"Prefetch failed for {url}: {e}")
+
+def schedule_prefetch(urls):
+    """Resolves upcoming episodes into the cache using spare capacity only."""
+    if not PREFETCH_ENABLED:
+        return
+    for url in urls[:PREFETCH_MAX]:
+        cached = cache.peek(normalize_url(mirrors.rewrite(url)))
+        if cached == "fresh":
+            continue
+        _spawn(_prefetch_one(url))
+
 @app.get("/")
 def home():
-    return {"status": "running", "message": "FaselHD Scraper API is active."}
+    fleet, pool = _browser_backend()
+    return {
+        "status": "running",
+        "message": "FaselHD Scraper API is active.",
+        "pool": pool.stats() if pool else None,
+        "fleet": fleet.stats() if fleet else None,
+        "mirror": mirrors.get_mirror_resolver().stats(),
+        "jobs": scheduler.stats(),
+        "cache": cache.stats(),
+        "relay": segment_cache.stats() if relay.RELAY_ENABLED else None,
+        "downloads": downloads.stats(),
+        "startup": dict(startup, ready=is_ready())
+    }
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 until warm-up is done, so autoscalers route traffic only to warm instances."""
+    body = dict(startup, ready=is_ready())
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics: per-phase scrape histograms, outcomes, request latency and component state."""
+    fleet, pool = _browser_backend()
+    components = {
+        "pool": pool.stats() if pool else {},
+        "fleet": fleet.stats() if fleet else {},
+        "jobs": scheduler.stats(),
+        "cache": cache.stats(),
+        "relay": segment_cache.stats() if relay.RELAY_ENABLED else {},
+        "downloads": downloads.stats(),
+    }
+    for component, fields in components.items():
+        for field, value in fields.items():
+            STATE.set(value, component=component, field=field)
+    for phase, value in startup.items():
+        if value is not None:
+            STARTUP.set(value, phase=phase.replace("_seconds", ""))
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/scrape")
-def scrape_endpoint(url: str):
+async def scrape_endpoint(request: Request, url: str, prefetch: List[str] = Query(default=[])):
+    """
+    Resolves one episode. `prefetch` optionally lists the episodes likely to be
+    requested next; they are resolved into the cache in the background.
+    """
     print(f"Received scrape request for: {url}")
-    result = scrape_stream_app_mode(url)
+    try:
+        # Cache first; concurrent misses for the same URL share one scrape
+        result = await resolve_cached(url)
+    except Saturated as e:
+        raise HTTPException(status_code=429, detail=f"Scraper busy: {e}", headers={"Retry-After": "10"})
     
     if result and "error" in result:
         # If scraper reported an error, we return it but with 200 OK so frontend can display it
@@ -30,9 +306,264 @@ def scrape_endpoint(url: str):
     
     if not result:
         return {"error": "Scraper returned no data."}
-        
+
+    if prefetch:
+        schedule_prefetch(prefetch)
+    if relay.RELAY_ENABLED and result.get("url"):
+        # Header-free link for players that cannot send Referer/User-Agent
+        token = relay.encode_headers(result.get("headers"))
+        result = dict(result, relay_url=relay.relay_link(_relay_base(request), "playlist", result["url"], token))
     return result
 
+@app.get("/probe")
+async def probe_endpoint(url: str, referer: Optional[str] = None, user_agent: Optional[str] = None):
+    """
+    Parses a master playlist (all variant and EXT-X-MEDIA attributes) and
+    summarizes every variant's media playlist.
+    """
+    headers = {}
+    if referer: headers["Referer"] = referer
+    if user_agent: headers["User-Agent"] = user_agent
+    try:
+        return await hls.aprobe(url, headers)
+    except Exception as e:
+        return {"error": f"Probe failed: {e}"}
+
+# --- HLS relay ---
+
+def _relay_base(request):
+    return RELAY_PUBLIC_URL or str(request.base_url).rstrip("/")
+
+def _relay_headers(u, h, s):
+    if not relay.RELAY_ENABLED:
+        raise HTTPException(status_code=404, detail="Relay disabled.")
+    if not relay.verify(u, h, s):
+        raise HTTPException(status_code=403, detail="Invalid relay signature.")
+    try:
+        return relay.decode_headers(h)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid relay headers.")
+
+@app.get("/relay/playlist")
+async def relay_playlist(request: Request, u: str, h: str, s: str):
+    """Fetches an upstream playlist with the stream's headers and rewrites it to point back here."""
+    headers = _relay_headers(u, h, s)
+    try:
+        resp = await http_client.aget(u, headers=headers)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
+    if resp.status_code != 200:
+        raise HTTPException(status_code=502, detail=f"Upstream returned {resp.status_code}")
+    body = relay.rewrite_playlist(resp.text, str(resp.url), _relay_base(request), h)
+    return Response(body, media_type=relay.PLAYLIST_CONTENT_TYPE, headers={"Cache-Control": "no-cache"})
+
+class _RelayResponse(StreamingResponse):
+    """StreamingResponse that runs `cleanup` once sent, even if its body never started streaming."""
+    def __init__(self, *args, cleanup, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.cleanup()
+
+def _cached_segment_response(cached):
+    where, payload, content_type = cached
+    if where == "memory":
+        return Response(payload, media_type=content_type)
+    return FileResponse(payload, media_type=content_type)
+
+@app.get("/relay/segment")
+async def relay_segment(request: Request, u: str, h: str, s: str):
+    """
+    Streams a segment (or key) through with the stream's headers. Whole,
+    cacheable responses are kept in the segment cache; concurrent viewers of
+    the same segment wait for the first upstream fetch instead of repeating it.
+    """
+    headers = _relay_headers(u, h, s)
+    range_header = request.headers.get("range")
+    key = SegmentCache.key_for(u)
+
+    if not range_header:
+        cached = segment_cache.get(key)
+        if cached is None and key in _segment_fetches:
+            try:
+                await asyncio.wait_for(_segment_fetches[key].wait(), timeout=relay.SEGMENT_WAIT_TIMEOUT)
+                cached = segment_cache.get(key)
+            except asyncio.TimeoutError:
+                print(f"[RELAY] Gave up waiting on a concurrent fetch of {u}, fetching it directly")
+        if cached is not None:
+            return _cached_segment_response(cached)
+    else:
+        headers = dict(headers, Range=range_header)
+
+    client = http_client.get_async_client()
+    try:
+        upstream = await client.send(client.build_request("GET", u, headers=headers), stream=True)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
+    if upstream.status_code >= 400:
+        await upstream.aclose()
+        raise HTTPException(status_code=502, detail=f"Upstream returned {upstream.status_code}")
+
+    length = upstream.headers.get("content-length")
+    try:
+        size = int(length) if length is not None else None
+    except ValueError:
+        # Malformed upstream header: stream without it
+        size = length = None
+    cacheable = (
+        not range_header and upstream.status_code == 200
+        and (size is None or size <= relay.SEGMENT_CACHE_MAX_ITEM)
+        and key not in _segment_fetches
+    )
+    done = None
+    if cacheable:
+        done = asyncio.Event()
+        _segment_fetches[key] = done
+    content_type = upstream.headers.get("content-type", "application/octet-stream")
+
+    async def cleanup():
+        # Runs from the body and again from the response; both steps are idempotent
+        await upstream.aclose()
+        if done is not None:
+            if _segment_fetches.get(key) is done:
+                del _segment_fetches[key]
+            done.set()
+
+    async def body():
+        buffer = bytearray() if cacheable else None
+        complete = False
+        try:
+            async for chunk in upstream.aiter_bytes():
+                if buffer is not None:
+                    buffer.extend(chunk)
+                    if len(buffer) > relay.SEGMENT_CACHE_MAX_ITEM:
+                        buffer = None
+                yield chunk
+            complete = True
+        finally:
+            await upstream.aclose()
+            if complete and buffer is not None:
+                # Spilling to disk may write a file: keep it off the event loop
+                await asyncio.to_thread(segment_cache.put, key, bytes(buffer), content_type)
+            await cleanup()
+
+    passthrough = {}
+    for name in ("content-range", "accept-ranges"):
+        if name in upstream.headers:
+            passthrough[name] = upstream.headers[name]
+    if length and "content-encoding" not in upstream.headers:
+        passthrough["content-length"] = length
+    return _RelayResponse(body(), status_code=upstream.status_code, media_type=content_type, headers=passthrough,
+                          cleanup=cleanup)
+
+async def _batch_item(index, url, limiter):
+    async with limiter:
+        try:
+            result = await resolve_cached(url)
+        except Exception as e:
+            # Per-item failures (including a saturated queue) never fail the batch
+            result = {"error": str(e)}
+    if not result:
+        result = {"error": "Scraper returned no data."}
+    return {"index": index, "url": url, "result": result}
+
+async def _stream_batch(urls, fmt):
+    # A batch may use at most the scheduler's slots, leaving the queue to other callers
+    limiter = asyncio.Semaphore(scheduler.concurrency)
+    tasks = [asyncio.create_task(_batch_item(i, u, limiter)) for i, u in enumerate(urls)]
+    ok = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            if "error" not in item["result"]:
+                ok += 1
+            yield _format_event(item, "result", fmt)
+        summary = {"done": True, "total": len(urls), "ok": ok, "failed": len(urls) - ok}
+        yield _format_event(summary, "done", fmt)
+    finally:
+        # Client went away: stop waiting. Jobs other requests have joined keep
+        # running for them; the scheduler drops the ones left without callers.
+        for task in tasks:
+            task.cancel()
+
+def _format_event(payload, event, fmt):
+    data = json.dumps(payload, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+@app.post("/scrape/batch")
+async def scrape_batch_endpoint(req: BatchRequest):
+    """
+    Resolves a whole season (season_url) or an explicit list of episode URLs
+    in parallel and streams each result as soon as it finishes.
+    """
+    if req.format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    urls = list(req.urls or [])
+    if req.season_url:
+        urls.extend(await _season_episodes(req.season_url))
+    # Drop duplicates while keeping episode order
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        raise HTTPException(status_code=400, detail="No episode URLs to resolve.")
+    if len(urls) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch too large ({len(urls)} > {BATCH_MAX_ITEMS}).")
+
+    print(f"Received batch request for {len(urls)} episode(s)")
+    media_type = "text/event-stream" if req.format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream_batch(urls, req.format), media_type=media_type)
+
+# --- Downloads ---
+
+@app.post("/download")
+async def download_endpoint(req: DownloadRequest):
+    """
+    Starts background downloads of an episode, a whole season or a resolved
+    playlist into HLS_DOWNLOAD_DIR. Returns the queued jobs; poll /download/{id}.
+    """
+    if req.master_url:
+        headers = {}
+        if req.referer: headers["Referer"] = req.referer
+        if req.user_agent: headers["User-Agent"] = req.user_agent
+        return {"jobs": [downloads.submit(master_url=req.master_url, headers=headers, quality=req.quality)]}
+    urls = [mirrors.rewrite(req.url)] if req.url else []
+    if req.season_url:
+        urls.extend(await _season_episodes(req.season_url))
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        raise HTTPException(status_code=400, detail="No episode URLs to download.")
+    if len(urls) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many episodes ({len(urls)} > {BATCH_MAX_ITEMS}).")
+    return {"jobs": [downloads.submit(episode_url=url, quality=req.quality) for url in urls]}
+
+@app.get("/download/{job_id}")
+def download_status(job_id: str):
+    """Status, throughput and progress of a download job."""
+    job = downloads.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown download job.")
+    return downloads.public(job)
+
+@app.get("/download/{job_id}/file")
+def download_file(job_id: str):
+    job = downloads.get(job_id)
+    if not job or job["status"] != "done":
+        raise HTTPException(status_code=404, detail="Download not finished.")
+    return FileResponse(job["output"], media_type="video/mp2t", filename=os.path.basename(job["output"]))
+
+@app.delete("/download/{job_id}")
+def cancel_download(job_id: str):
+    """Cancels a running job; its manifest stays, so a new job for the same episode resumes."""
+    job = downloads.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown download job.")
+    return downloads.public(job)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=10000)
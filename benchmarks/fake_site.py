@@ -0,0 +1,189 @@
+"""
+Local stand-in for the FaselHD site, served from the recorded fixtures in
+benchmarks/fixtures so benchmarks never touch the live site.
+
+Routes:
+    /, /?s=<query>                    search results (div.postDiv)
+    /seasons/<slug>                   season hub (div.seasonDiv with onclick) + episode list
+    /season/<slug>                    episode list
+    /episode/<n>                      episode page with player_iframe and .server--item buttons
+    /video_player?player_token=<n>    player page referencing the master playlist
+    /hls/<token>/master.m3u8          master playlist
+    /hls/<token>/<height>.m3u8        media playlist with SEGMENTS segments
+    /hls/<token>/seg_<n>.ts           SEGMENT_BYTES of filler per segment
+    /hls/aes/index.m3u8               AES-128 media playlist (IV from the sequence number, then explicit)
+    /hls/aes/key.bin, seg_<n>.ts      its key and pre-encrypted segments from fixtures/aes
+"""
+import os
+import hashlib
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EPISODES_PER_SEASON = 16
+SEGMENTS = 600
+SEGMENT_BYTES = 64 * 1024
+VARIANTS = [(1080, 5000000), (720, 2800000), (480, 1400000), (360, 800000)]
+# fixtures/aes holds AES_SEGMENTS segments of aes_plaintext(n), encrypted with
+# openssl enc -aes-128-cbc under key.bin (bytes 0..15); segments from
+# AES_EXPLICIT_FROM on use AES_EXPLICIT_IV instead of their sequence number
+AES_SEGMENTS = 4
+AES_SEGMENT_BYTES = 16000
+AES_EXPLICIT_FROM = 2
+AES_EXPLICIT_IV = "0x0f0e0d0c0b0a09080706050403020100"
+
+
+def _filler(name, size):
+    # Stamped with the segment name so misordered writes are detectable
+    name = name.encode()
+    return (name * (size // len(name) + 1))[:size]
+
+
+def aes_plaintext(n):
+    """Decrypted content of encrypted segment n."""
+    return _filler(f"seg_{n:05d}.ts", AES_SEGMENT_BYTES)
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def _render(name, **values):
+    # Plain substitution: fixtures contain JS/JSON braces that str.format would trip on
+    text = _fixture(name)
+    for key, value in values.items():
+        text = text.replace("{" + key + "}", str(value))
+    return text
+
+
+def _episode_list(base, slug):
+    # Newest first, as the site lists them
+    links = "\n".join(
+        f'  <a href="{base}/episode/{n}">الحلقة {n}</a>'
+        for n in range(EPISODES_PER_SEASON, 0, -1)
+    )
+    return f'<div class="epAll">\n{links}\n</div>'
+
+
+def _master(token):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3",
+             '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="Arabic",LANGUAGE="ar",DEFAULT=YES,URI="audio.m3u8"']
+    for height, bandwidth in VARIANTS:
+        width = height * 16 // 9
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height},'
+                     f'CODECS="avc1.640028,mp4a.40.2",FRAME-RATE=23.976,AUDIO="aud"')
+        lines.append(f"{height}.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def _media(segments=SEGMENTS):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:6",
+             "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+    for i in range(segments):
+        lines.append("#EXTINF:6.006,")
+        lines.append(f"seg_{i:05d}.ts")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def _aes_media():
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:6",
+             "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD", '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"']
+    for i in range(AES_SEGMENTS):
+        if i == AES_EXPLICIT_FROM:
+            lines.append(f'#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV={AES_EXPLICIT_IV}')
+        lines.append("#EXTINF:6.006,")
+        lines.append(f"seg_{i:05d}.ts")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without this, Nagle + delayed ACK adds ~40 ms per response
+    disable_nagle_algorithm = True
+    # Filler bytes appended to episode/player pages to mimic heavy, ad-laden markup
+    page_padding = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type="text/html; charset=utf-8", status=200):
+        data = body if isinstance(body, bytes) else body.encode("utf-8")
+        # Pages carry an ETag and honour If-None-Match, like the site's CDN
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parts.query)
+        path = urllib.parse.unquote(parts.path)
+        base = f"http://{self.headers.get('Host')}"
+        padding = "<!-- " + "x" * self.page_padding + " -->" if self.page_padding else ""
+
+        if path == "/":
+            # Home page doubles as the search page (mirror probes GET /)
+            return self._send(_render("search.html", base=base))
+        if path.startswith("/seasons/"):
+            slug = path.split("/", 2)[2]
+            return self._send(_render("hub.html", base=base, episodes=_episode_list(base, slug)))
+        if path.startswith("/season/"):
+            slug = path.split("/", 2)[2]
+            return self._send(_render("season.html", base=base, title=slug, episodes=_episode_list(base, slug)))
+        if path.startswith("/episode/"):
+            number = path.rsplit("/", 1)[1]
+            return self._send(_render("episode.html", base=base, number=number, padding=padding))
+        if path == "/video_player":
+            token = query.get("player_token", ["0"])[0]
+            return self._send(_render("player.html", base=base, token=token, padding=padding))
+        if path.startswith("/hls/aes/"):
+            name = path.rsplit("/", 1)[1]
+            if name == "index.m3u8":
+                return self._send(_aes_media(), "application/vnd.apple.mpegurl")
+            fixture = os.path.join(FIXTURES, "aes", name)
+            if "/" not in name and os.path.isfile(fixture):
+                with open(fixture, "rb") as f:
+                    return self._send(f.read(), "application/octet-stream")
+            return self._send("not found", "text/plain", 404)
+        if path.startswith("/hls/") and path.endswith(".ts"):
+            return self._send(_filler(path.rsplit("/", 1)[1], SEGMENT_BYTES), "video/mp2t")
+        if path.startswith("/hls/") and path.endswith(".m3u8"):
+            name = path.rsplit("/", 1)[1]
+            token = path.split("/")[2]
+            body = _master(token) if name == "master.m3u8" else _media()
+            return self._send(body, "application/vnd.apple.mpegurl")
+        self._send("not found", "text/plain", 404)
+
+
+def start(port=0, page_padding=0):
+    """Starts the fake site in a daemon thread. Returns (server, base_url)."""
+    handler = type("Handler", (FakeSiteHandler,), {"page_padding": page_padding})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    import sys
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8800
+    server, base = start(port)
+    print(f"Fake FaselHD site on {base} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,284 @@
+"""
+Offline benchmark harness. Serves the recorded fixtures from a local fake
+site and measures:
+    - catalog/HLS parsing (the work behind search_fasel, get_seasons,
+      get_episodes and parse_m3u8),
+    - the same calls end-to-end over HTTP,
+    - /scrape latency and throughput under concurrent load (cold and warm cache),
+    - HLS downloads of a clear and an AES-128 playlist (the latter needs
+      the "cryptography" package), checking the written bytes,
+    - cold start: importing the API and its first /scrape in a fresh interpreter.
+
+Results are written as JSON for regression comparison:
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import shutil
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# The API must run browserless and keep all its state in a throwaway directory
+# (removed by main()); set before importing it
+os.environ.setdefault("SCRAPER_POOL_SIZE", "0")
+BENCH_DIR = tempfile.mkdtemp(prefix="fasel-bench-")
+os.environ["SCRAPER_CACHE_PATH"] = os.path.join(BENCH_DIR, "results.sqlite")
+os.environ["CATALOG_CACHE_PATH"] = os.path.join(BENCH_DIR, "catalog.sqlite")
+os.environ["CATALOG_INDEX_PATH"] = os.path.join(BENCH_DIR, "index.sqlite")
+os.environ["SCRAPER_SERVER_STATS_PATH"] = os.path.join(BENCH_DIR, "servers.sqlite")
+os.environ["SCRAPER_SESSION_PATH"] = os.path.join(BENCH_DIR, "session.json")
+os.environ["FASEL_MIRROR_STATE_PATH"] = os.path.join(BENCH_DIR, "mirror.json")
+os.environ["RELAY_CACHE_DIR"] = os.path.join(BENCH_DIR, "segments")
+
+import httpx
+import fake_site
+from stream_scraper import catalog, catalog_cache, download, hls, http_client
+
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "results", "latest.json")
+
+
+def summarize(samples, wall=None):
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    result = {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(pct(50) * 1000, 3),
+        "p95_ms": round(pct(95) * 1000, 3),
+        "p99_ms": round(pct(99) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+    total = wall if wall is not None else sum(ordered)
+    result["ops_per_sec"] = round(len(ordered) / total, 2) if total else None
+    return result
+
+
+def bench(fn, iterations, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def bench_parsing(base, iterations):
+    client = httpx.Client()
+    search_html = client.get(base, params={"s": "squid"}).text
+    hub_url = f"{base}/seasons/squid-game"
+    hub_html = client.get(hub_url).text
+    season_html = client.get(f"{base}/season/squid-game-1").text
+    master_url = f"{base}/hls/1/master.m3u8"
+    master_text = client.get(master_url).text
+    media_text = client.get(f"{base}/hls/1/1080.m3u8").text
+    client.close()
+
+    def scan_media():
+        scanner = hls.MediaPlaylistScanner()
+        for line in media_text.splitlines():
+            scanner.feed(line)
+        return scanner.summary()
+
+    return {
+        "parse.search": bench(lambda: catalog.parse_search_results(search_html), iterations),
+        "parse.seasons": bench(lambda: catalog.parse_seasons(hub_html, hub_url), iterations),
+        "parse.episodes": bench(lambda: catalog.parse_episodes(season_html), iterations),
+        "parse.m3u8_master": bench(lambda: hls.parse_master(master_text, master_url), iterations),
+        "parse.m3u8_media": bench(scan_media, iterations),
+    }
+
+
+def bench_fetching(base, iterations):
+    shared = catalog_cache.get_catalog_cache()
+    # Entries that expire as soon as they are written: every call goes to the site
+    catalog_cache._cache = catalog_cache.CatalogCache(ttl=0, max_stale=0)
+    try:
+        results = {
+            "fetch.search_fasel": bench(lambda: catalog.search(base, "squid"), iterations),
+            "fetch.get_seasons": bench(lambda: catalog.fetch_seasons(f"{base}/seasons/squid-game"), iterations),
+            "fetch.get_episodes": bench(lambda: catalog.fetch_episodes(f"{base}/season/squid-game-1"), iterations),
+        }
+    finally:
+        catalog_cache._cache = shared
+    results["fetch.search_fasel_cached"] = bench(lambda: catalog.search(base, "squid"), iterations)
+    results["fetch.parse_m3u8"] = bench(lambda: hls.probe(f"{base}/hls/1/master.m3u8"), iterations)
+    return results
+
+
+def _download(url, expected_size, expected=None):
+    output = os.path.join(BENCH_DIR, "download.ts")
+    download.HLSDownload(url, output).run()
+    with open(output, "rb") as f:
+        data = f.read()
+    os.remove(output)
+    if len(data) != expected_size or (expected is not None and data != expected):
+        raise AssertionError(f"Downloaded {url} does not match the fixture")
+
+
+def bench_download(base, runs):
+    results = {
+        "download.clear": bench(lambda: _download(f"{base}/hls/1/720.m3u8",
+                                                  fake_site.SEGMENTS * fake_site.SEGMENT_BYTES), runs, warmup=1),
+    }
+    if download.AES_AVAILABLE:
+        plain = b"".join(fake_site.aes_plaintext(n) for n in range(fake_site.AES_SEGMENTS))
+        results["download.aes"] = bench(lambda: _download(f"{base}/hls/aes/index.m3u8", len(plain), plain),
+                                        runs, warmup=1)
+    else:
+        print("Skipping download.aes: the 'cryptography' package is not installed")
+    return results
+
+
+async def _load(app, urls, concurrency):
+    limiter = asyncio.Semaphore(concurrency)
+    samples = []
+    failures = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def one(url):
+            nonlocal failures
+            async with limiter:
+                started = time.perf_counter()
+                resp = await client.get("/scrape", params={"url": url})
+                samples.append(time.perf_counter() - started)
+                if resp.status_code != 200 or "error" in resp.json():
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(u) for u in urls))
+        wall = time.perf_counter() - started
+    result = summarize(samples, wall)
+    result["failures"] = failures
+    result["concurrency"] = concurrency
+    return result
+
+
+def bench_scrape(base, requests, concurrency):
+    import api
+    urls = [f"{base}/episode/{n}" for n in range(1, requests + 1)]
+    return {
+        "scrape.cold": asyncio.run(_load(api.app, urls, concurrency)),
+        "scrape.warm": asyncio.run(_load(api.app, urls, concurrency)),
+    }
+
+
+# Runs in a fresh interpreter: prints import seconds and first /scrape seconds
+_STARTUP_SCRIPT = """
+import sys, time, asyncio
+started = time.perf_counter()
+import api, httpx
+imported = time.perf_counter()
+
+async def first():
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        await client.get("/scrape", params={"url": sys.argv[1]})
+
+asyncio.run(first())
+print(imported - started, time.perf_counter() - imported)
+"""
+
+
+def bench_startup(base, runs):
+    imports, firsts = [], []
+    for run in range(runs):
+        env = dict(os.environ, SCRAPER_CACHE_PATH=os.path.join(BENCH_DIR, f"startup-{run}.sqlite"))
+        out = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, f"{base}/episode/{run + 1}"],
+                             cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        import_seconds, first_seconds = map(float, out.strip().splitlines()[-1].split())
+        imports.append(import_seconds)
+        firsts.append(first_seconds)
+    return {
+        "startup.import_api": summarize(imports),
+        "startup.first_scrape": summarize(firsts),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\n{'benchmark':<24}{'baseline p50':>14}{'p50':>12}{'change':>10}")
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if not old:
+            print(f"{name:<24}{'-':>14}{stats['p50_ms']:>12.3f}{'new':>10}")
+            continue
+        change = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0
+        print(f"{name:<24}{old['p50_ms']:>14.3f}{stats['p50_ms']:>12.3f}{change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline FaselHD scraper benchmarks")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=64, help="/scrape requests per load run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--padding", type=int, default=200_000,
+                        help="filler bytes added to episode/player pages")
+    parser.add_argument("--startup-runs", type=int, default=5, help="fresh interpreters for cold-start timing")
+    parser.add_argument("--download-runs", type=int, default=5, help="runs of each download benchmark")
+    parser.add_argument("--only", choices=["parse", "fetch", "scrape", "startup", "download"], action="append")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    args = parser.parse_args()
+    try:
+        run(args)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+
+def run(args):
+    server, base = fake_site.start(page_padding=args.padding)
+    print(f"Fake site: {base}")
+    only = set(args.only or ["parse", "fetch", "scrape", "startup", "download"])
+    results = {}
+    if "parse" in only:
+        results.update(bench_parsing(base, args.iterations))
+    if "fetch" in only:
+        results.update(bench_fetching(base, args.iterations))
+    if "scrape" in only:
+        results.update(bench_scrape(base, args.requests, args.concurrency))
+    if "startup" in only:
+        results.update(bench_startup(base, args.startup_runs))
+    if "download" in only:
+        results.update(bench_download(base, args.download_runs))
+    server.shutdown()
+
+    for name, stats in results.items():
+        print(f"{name:<24} p50 {stats['p50_ms']:>9.3f} ms  p95 {stats['p95_ms']:>9.3f} ms  {stats['ops_per_sec']} ops/s")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "http2": http_client.HTTP2,
+        "args": vars(args),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
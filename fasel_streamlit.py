@@ -1,10 +1,6 @@
 import streamlit as st
-import httpx
-from selectolax.parser import HTMLParser
 import sys
 import os
-import re
-import urllib.parse
 
 # Add scraper logic to path
 current_dir = os.getcwd()
@@ -13,142 +9,140 @@ if scraper_path not in sys.path:
     sys.path.append(scraper_path)
 
 # from scraper import scrape_stream_app_mode
+from stream_scraper import catalog, catalog_index, http_client, hls, mirrors
+from stream_scraper.http_client import run_sync
 
-# Constants
-BASE_URL = "https://web12818x.faselhdx.bid"
+# Constants (the site's base URL comes from the mirror resolver, see get_mirror_resolver)
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
 }
 
 # --- Backend Functions ---
 
-@st.cache_data(ttl=3600)
+@st.cache_resource
+def get_mirror_resolver():
+    """Fastest live site mirror, re-probed in the background (FASEL_MIRRORS lists candidates)."""
+    resolver = mirrors.get_mirror_resolver()
+    resolver.start_background()
+    return resolver
+
+def _on_mirror(items):
+    # Links saved under an older domain are moved onto the current mirror
+    return [dict(item, link=mirrors.rewrite(item['link'])) for item in items]
+
+@st.cache_resource
+def get_catalog_index():
+    """
+    Local catalog index shared by all sessions. It is only read here: build
+    it with `python -m stream_scraper.catalog_index`, or set
+    CATALOG_INDEX_CRAWL=1 in a single UI process to crawl in the background
+    (every process crawling would hammer the site with duplicate requests).
+    """
+    index = catalog_index.CatalogIndex()
+    if os.environ.get("CATALOG_INDEX_CRAWL", "0") == "1":
+        catalog_index.CatalogCrawler(index).start_background()
+    return index
+
 def search_fasel(query):
-    params = {"s": query}
+    # Answered locally once the index has been filled; the live site is the fallback
+    get_mirror_resolver()
+    index = get_catalog_index()
+    if index.count():
+        results = index.search(query)
+        if results:
+            return results
+    return search_fasel_live(query)
+
+# Live lookups go through catalog_cache, shared by every UI and API process.
+# They fetch strictly so a mirror that stops answering is failed over.
+def search_fasel_live(query):
     try:
-        resp = httpx.get(BASE_URL, params=params, headers=HEADERS, timeout=10, follow_redirects=True)
-        tree = HTMLParser(resp.text)
-        results = []
-        for node in tree.css("div.postDiv"):
-            title_node = node.css_first("div.postInner h1, div.h1")
-            link_node = node.css_first("a")
-            img_node = node.css_first("div.imgdiv-class img")
-            img_src = None
-            if img_node:
-                img_src = img_node.attributes.get("data-src") or img_node.attributes.get("src")
-            if title_node and link_node:
-                results.append({
-                    "title": title_node.text(strip=True),
-                    "link": link_node.attributes.get("href"),
-                    "img": img_src
-                })
-        return results
-    except: return []
+        return _on_mirror(mirrors.with_failover(lambda base: catalog.search(base, query, strict=True)))
+    except Exception:
+        return []
 
-@st.cache_data(ttl=3600)
-def get_seasons(hub_url):
+def _fetch_live(url, fetch):
     try:
-        resp = httpx.get(hub_url, headers=HEADERS, timeout=10, follow_redirects=True)
-        tree = HTMLParser(resp.text)
-        seasons = []
-        # Support both 'seasons/' hubs and normal series pages with season selection
-        for node in tree.css("div.seasonDiv"):
-            title_node = node.css_first("div.title")
-            title = title_node.text(strip=True) if title_node else "Unknown Season"
-            
-            onclick = node.attributes.get("onclick")
-            link = None
-            if onclick:
-                # Extract URL from window.location.href = '...'
-                match = re.search(r"window\.location\.href\s*=\s*['\"]([^'\"]+)['\"]", onclick)
-                if match:
-                    link = match.group(1)
-                    if not link.startswith("http"):
-                        link = urllib.parse.urljoin(hub_url, link)
-            
-            if not link:
-                # Check parent or child <a>
-                a_tag = node.css_first("a") or (node.parent if node.parent and node.parent.tag == "a" else None)
-                if a_tag:
-                    link = a_tag.attributes.get("href")
-            
-            if link:
-                seasons.append({"title": title, "link": link})
-        return seasons
-    except: return []
+        return _on_mirror(mirrors.fetch_on_mirror(url, lambda u: fetch(u, strict=True)))
+    except Exception:
+        return []
+
+def get_seasons(hub_url):
+    hub_url = mirrors.rewrite(hub_url)
+    seasons = get_catalog_index().seasons(hub_url)
+    return seasons if seasons is not None else get_seasons_live(hub_url)
+
+def get_seasons_live(hub_url):
+    return _fetch_live(hub_url, catalog.fetch_seasons)
 
-@st.cache_data(ttl=3600)
 def get_episodes(series_url):
+    series_url = mirrors.rewrite(series_url)
+    episodes = get_catalog_index().episodes(series_url)
+    return episodes if episodes is not None else get_episodes_live(series_url)
+
+def get_episodes_live(series_url):
+    return _fetch_live(series_url, catalog.fetch_episodes)
+
+def load_series(hub_url):
+    """
+    Returns (seasons, {url: episodes}) for a title, from the index when it
+    has been crawled, otherwise loaded live.
+    """
+    hub_url = mirrors.rewrite(hub_url)
+    index = get_catalog_index()
+    seasons = index.seasons(hub_url)
+    if seasons is not None:
+        episode_lists = {s['link']: index.episodes(s['link']) for s in seasons}
+        episode_lists[hub_url] = index.episodes(hub_url)
+        if all(v is not None for v in episode_lists.values()):
+            return seasons, episode_lists
+    return load_series_live(hub_url)
+
+def load_series_live(hub_url):
+    """
+    Loads a title's seasons and episode lists concurrently: the hub page once,
+    then every season's episode list in parallel. Returns (seasons, {url: episodes}).
+    """
+    def load(url):
+        seasons, hub_episodes = run_sync(catalog.aload_series(url, strict=True))
+        # Season links point at the mirror that just answered for the hub
+        episode_lists = run_sync(catalog.aload_season_episodes([s['link'] for s in seasons]))
+        return seasons, hub_episodes, [episode_lists[s['link']] for s in seasons]
     try:
-        resp = httpx.get(series_url, headers=HEADERS, timeout=10, follow_redirects=True)
-        tree = HTMLParser(resp.text)
-        episodes = []
-        # More robust episode list selectors
-        for node in tree.css("div.epAll a, div.epNodes a, div.episodes-list a"):
-            title = node.text(strip=True)
-            link = node.attributes.get("href")
-            if link and ("الحلقة" in title or "Episode" in title):
-                episodes.append({
-                    "title": title,
-                    "link": link
-                })
-        
-        # Deduplicate
-        seen = set()
-        unique_eps = []
-        for ep in episodes:
-            if ep['link'] not in seen:
-                unique_eps.append(ep)
-                seen.add(ep['link'])
-        
-        # Sort so 1 is first if naturally descending
-        if unique_eps and "الحلقة 1" in unique_eps[-1]['title'] and len(unique_eps) > 1:
-            unique_eps = unique_eps[::-1]
-        return unique_eps
-    except: return []
+        seasons, hub_episodes, season_episodes = mirrors.fetch_on_mirror(hub_url, load)
+    except Exception:
+        return [], {hub_url: []}
+    seasons = _on_mirror(seasons)
+    episode_lists = {s['link']: _on_mirror(eps) for s, eps in zip(seasons, season_episodes)}
+    episode_lists[hub_url] = _on_mirror(hub_episodes)
+    return seasons, episode_lists
 
 def parse_m3u8(master_url, referer):
     """
-    Parses a master m3u8 playlist to extract quality variants.
+    Parses a master m3u8 playlist into quality variants, probing every
+    variant's media playlist concurrently for duration/segment details.
     """
     try:
         headers = {
             "User-Agent": HEADERS["User-Agent"],
             "Referer": referer
         }
-        resp = httpx.get(master_url, headers=headers, follow_redirects=True, timeout=10)
-        content = resp.text
-        
-        lines = content.splitlines()
+        master = hls.probe(master_url, headers)
         variants = []
-        
-        current_res = "Unknown"
-        for i, line in enumerate(lines):
-            if line.startswith("#EXT-X-STREAM-INF"):
-                # Extract Resolution
-                match = re.search(r'RESOLUTION=(\d+x\d+)', line)
-                if match:
-                    current_res = match.group(1)
-                else:
-                    current_res = "Auto/Other"
-            elif line.strip() and not line.startswith("#"):
-                # This is the URL for the previous STREAM-INF
-                variant_url = line.strip()
-                if not variant_url.startswith("http"):
-                    variant_url = urllib.parse.urljoin(master_url, variant_url)
-                
-                variants.append({
-                    "quality": current_res,
-                    "url": variant_url
-                })
+        for v in master["variants"]:
+            v["quality"] = v.get("resolution") or "Auto/Other"
+            variants.append(v)
+        # Highest bandwidth first, like players list them
+        variants.sort(key=lambda v: v.get("bandwidth") or 0, reverse=True)
         return variants
     except Exception as e:
         st.error(f"Failed to parse M3U8: {e}")
         return []
 
-def fetch_stream_from_api(target_url):
+def fetch_stream_from_api(target_url, prefetch=None):
     """
     Calls the Backend API on Render to scrape the stream.
+    `prefetch` lists episodes the API should resolve into its cache in the background.
     """
     # Get API URL from secrets or default to local
     # Remove trailing slash if present
@@ -157,7 +151,10 @@ def fetch_stream_from_api(target_url):
     
     try:
         # 180s timeout: Render free tier can take 30-60s to cold start, plus scraping time
-        resp = httpx.get(scrape_endpoint, params={"url": target_url}, timeout=180.0)
+        params = {"url": target_url}
+        if prefetch:
+            params["prefetch"] = prefetch
+        resp = http_client.get(scrape_endpoint, params=params, timeout=180.0, retries=0)
         if resp.status_code == 200:
             return resp.json()
         else:
@@ -188,6 +185,8 @@ if "selected_episode" not in st.session_state:
 with st.sidebar:
     st.header("Search")
     query = st.text_input("Find Content", placeholder="e.g. Squid Game")
+    prefetch_next = st.toggle("Prefetch next episodes", value=False,
+                              help="Resolve the next episodes in the background so their links are ready instantly.")
     if query:
         results = search_fasel(query)
         if results:
@@ -215,9 +214,10 @@ if st.session_state.selected_item:
         is_hub = "seasons" in item['link']
         
         target_url = item['link']
+        next_links = []
         
         # Step 1: Season Selection (if hub or multiple seasons detected)
-        seasons = get_seasons(item['link'])
+        seasons, episode_lists = load_series(item['link'])
         if seasons:
             season_titles = [s['title'] for s in seasons]
             # Find default index
@@ -242,7 +242,8 @@ if st.session_state.selected_item:
         is_series = "مسلسل" in item['title'] or "season" in item['link'] or seasons
         if is_series:
             ep_url = st.session_state.selected_season['link'] if st.session_state.selected_season else item['link']
-            episodes = get_episodes(ep_url)
+            # Already loaded concurrently with the seasons in most cases
+            episodes = episode_lists[ep_url] if ep_url in episode_lists else get_episodes(ep_url)
             if episodes:
                 ep_titles = [e['title'] for e in episodes]
                 # Find default index
@@ -260,7 +261,10 @@ if st.session_state.selected_item:
                     st.session_state.variants = None
                     # st.rerun() # Don't rerun immediately to allow button click, or handle state
                 
-                if sel_ep: target_url = sel_ep['link']
+                if sel_ep:
+                    target_url = sel_ep['link']
+                    ep_ix = episodes.index(sel_ep)
+                    next_links = [e['link'] for e in episodes[ep_ix + 1:ep_ix + 3]]
             else:
                 st.warning("No episodes found for this selection.")
         
@@ -268,7 +272,7 @@ if st.session_state.selected_item:
 
         if st.button("🚀 Fetch Stream Links", type="primary", use_container_width=True):
             with st.spinner("Extracting master playlist via Backend..."):
-                res = fetch_stream_from_api(target_url)
+                res = fetch_stream_from_api(target_url, prefetch=next_links if prefetch_next else None)
                 if res and "error" not in res:
                     st.session_state.current_stream = res
                     # Parse the m3u8 for qualities
@@ -281,6 +285,9 @@ if st.session_state.selected_item:
     if st.session_state.variants:
         st.divider()
         st.subheader("📥 Available Qualities")
+        relay_url = st.session_state.current_stream.get('relay_url')
+        if relay_url:
+            st.text_input("Relay link (plays directly, no headers needed)", value=relay_url, key="relay_url")
         
         for v in st.session_state.variants:
             with st.container(border=True):
@@ -288,6 +295,15 @@ if st.session_state.selected_item:
                 with c1:
                     st.markdown(f"### {v['quality'].split('x')[-1]}p" if 'x' in v['quality'] else f"### {v['quality']}")
                 with c2:
+                    details = []
+                    if v.get('bandwidth'): details.append(f"{v['bandwidth'] / 1_000_000:.2f} Mbps")
+                    if v.get('codecs'): details.append(v['codecs'])
+                    if v.get('frame_rate'): details.append(f"{v['frame_rate']:g} fps")
+                    media = v.get('media_playlist')
+                    if media:
+                        details.append(f"{media['segments']} segments, {media['duration'] / 60:.1f} min")
+                        if media.get('encryption'): details.append(f"encrypted ({', '.join(media['encryption'])})")
+                    if details: st.caption(" · ".join(details))
                     st.text_input("URL", value=v['url'], key=f"url_{v['url']}")
                     # Note: We can't use standard download buttons easily for m3u8 links without content,
                     # but we can provide a copyable VLC command.
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import urllib.parse
+
+CACHE_PATH = os.environ.get("SCRAPER_CACHE_PATH", "/tmp/fasel_results.sqlite")
+CACHE_DEFAULT_TTL = int(os.environ.get("SCRAPER_CACHE_TTL", "1800"))
+CACHE_STALE_GRACE = int(os.environ.get("SCRAPER_CACHE_STALE_GRACE", "600"))
+CACHE_MAX_BYTES = int(os.environ.get("SCRAPER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Stop serving a tokenized link this long before the CDN says it expires
+EXPIRY_SAFETY = 30
+# Start revalidating once this fraction of a token's remaining lifetime has passed
+REFRESH_FRACTION = 0.8
+
+# Query parameters that carry an absolute unix expiry
+_EXPIRY_PARAMS = ("expires", "expire", "expiry", "exp", "e", "validto", "valid_to", "deadline")
+# Expiry embedded inside a token value, e.g. Akamai "hdnts=st=..~exp=1700000000~acl=.."
+_EMBEDDED_EXPIRY_RE = re.compile(r"(?:^|[~&,;:])exp(?:ires)?=(\d{9,11})")
+
+
+def normalize_url(url):
+    """
+    Canonical cache key for an episode URL: lowercase scheme/host, no
+    fragment, no trailing slash, sorted query string, stable percent-encoding.
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    path = urllib.parse.quote(urllib.parse.unquote(parts.path), safe="/-_.~")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def expiry_from_m3u8(url):
+    """Returns the unix expiry encoded in a stream URL's token parameters, or None."""
+    params = urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query, keep_blank_values=True)
+    for name, value in params:
+        if name.lower() in _EXPIRY_PARAMS and value.isdigit() and 9 <= len(value) <= 11:
+            return int(value)
+        match = _EMBEDDED_EXPIRY_RE.search(value)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def freshness_for(result, now=None):
+    """
+    Returns (fresh_until, expires_at) for a resolved result. Tokenized links
+    follow their expiry; everything else uses the default TTL plus a stale grace.
+    """
+    now = now or time.time()
+    expiry = expiry_from_m3u8(result.get("url", ""))
+    if expiry:
+        hard = expiry - EXPIRY_SAFETY
+        return now + max(0, (hard - now) * REFRESH_FRACTION), hard
+    return now + CACHE_DEFAULT_TTL, now + CACHE_DEFAULT_TTL + CACHE_STALE_GRACE
+
+
+class ResultCache:
+    """
+    Disk-backed (SQLite) cache for resolved stream results.
+
+    get() returns (value, state) where state is "fresh" or "stale" (still
+    usable, caller should revalidate), or None on a miss. Entries are evicted
+    least-recently-used once the stored payload exceeds max_bytes.
+    """
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, fresh_until REAL NOT NULL, expires_at REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results(accessed)")
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, fresh_until, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, fresh_until, expires_at = row
+            if now >= expires_at:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        if now < fresh_until:
+            self.hits += 1
+            return json.loads(value), "fresh"
+        self.stale_hits += 1
+        return json.loads(value), "stale"
+
+    def peek(self, key):
+        """Returns "fresh", "stale" or None without touching counters or LRU order."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fresh_until, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or now >= row[1]:
+            return None
+        return "fresh" if now < row[0] else "stale"
+
+    def set(self, key, result):
+        now = time.time()
+        fresh_until, expires_at = freshness_for(result, now)
+        if expires_at <= now:
+            return
+        value = json.dumps(result)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, value, len(value), now, fresh_until, expires_at, now)
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        rows = self._db.execute("SELECT key, size FROM results ORDER BY accessed ASC").fetchall()
+        total = sum(size for _, size in rows)
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,156 @@
+import re
+import asyncio
+import urllib.parse
+from selectolax.parser import HTMLParser
+
+try:
+    from stream_scraper.catalog_cache import get_catalog_cache
+except ImportError:
+    from catalog_cache import get_catalog_cache
+
+
+def parse_search_results(html):
+    tree = HTMLParser(html)
+    results = []
+    for node in tree.css("div.postDiv"):
+        title_node = node.css_first("div.postInner h1, div.h1")
+        link_node = node.css_first("a")
+        img_node = node.css_first("div.imgdiv-class img")
+        img_src = None
+        if img_node:
+            img_src = img_node.attributes.get("data-src") or img_node.attributes.get("src")
+        if title_node and link_node:
+            results.append({
+                "title": title_node.text(strip=True),
+                "link": link_node.attributes.get("href"),
+                "img": img_src
+            })
+    return results
+
+
+def parse_seasons(html, hub_url):
+    tree = HTMLParser(html)
+    seasons = []
+    # Support both 'seasons/' hubs and normal series pages with season selection
+    for node in tree.css("div.seasonDiv"):
+        title_node = node.css_first("div.title")
+        title = title_node.text(strip=True) if title_node else "Unknown Season"
+
+        onclick = node.attributes.get("onclick")
+        link = None
+        if onclick:
+            # Extract URL from window.location.href = '...'
+            match = re.search(r"window\.location\.href\s*=\s*['\"]([^'\"]+)['\"]", onclick)
+            if match:
+                link = match.group(1)
+                if not link.startswith("http"):
+                    link = urllib.parse.urljoin(hub_url, link)
+
+        if not link:
+            # Check parent or child <a>
+            a_tag = node.css_first("a") or (node.parent if node.parent and node.parent.tag == "a" else None)
+            if a_tag:
+                link = a_tag.attributes.get("href")
+
+        if link:
+            seasons.append({"title": title, "link": link})
+    return seasons
+
+
+def parse_episodes(html):
+    """
+    Extracts the ordered, de-duplicated episode list from a season/series page.
+    """
+    tree = HTMLParser(html)
+    episodes = []
+    # More robust episode list selectors
+    for node in tree.css("div.epAll a, div.epNodes a, div.episodes-list a"):
+        title = node.text(strip=True)
+        link = node.attributes.get("href")
+        if link and ("الحلقة" in title or "Episode" in title):
+            episodes.append({
+                "title": title,
+                "link": link
+            })
+
+    # Deduplicate
+    seen = set()
+    unique_eps = []
+    for ep in episodes:
+        if ep['link'] not in seen:
+            unique_eps.append(ep)
+            seen.add(ep['link'])
+
+    # Sort so 1 is first if naturally descending
+    if unique_eps and "الحلقة 1" in unique_eps[-1]['title'] and len(unique_eps) > 1:
+        unique_eps = unique_eps[::-1]
+    return unique_eps
+
+
+# --- Sync fetchers (shared catalog cache over the pooled client) ---
+# Failures give []; with strict=True they raise instead (transport errors, non-200 pages)
+
+def search(base_url, query, strict=False):
+    try:
+        return get_catalog_cache().get("search", base_url, lambda html, url: parse_search_results(html), params={"s": query})
+    except:
+        if strict: raise
+        return []
+
+
+def fetch_seasons(hub_url, strict=False):
+    try:
+        return get_catalog_cache().get("seasons", hub_url, parse_seasons)
+    except:
+        if strict: raise
+        return []
+
+
+def fetch_episodes(series_url, strict=False):
+    try:
+        return get_catalog_cache().get("episodes", series_url, lambda html, url: parse_episodes(html))
+    except:
+        if strict: raise
+        return []
+
+
+# --- Async fetchers ---
+
+async def asearch(base_url, query):
+    try:
+        return await get_catalog_cache().aget("search", base_url, lambda html, url: parse_search_results(html), params={"s": query})
+    except: return []
+
+
+async def afetch_seasons(hub_url):
+    try:
+        return await get_catalog_cache().aget("seasons", hub_url, parse_seasons)
+    except: return []
+
+
+async def afetch_episodes(series_url):
+    try:
+        return await get_catalog_cache().aget("episodes", series_url, lambda html, url: parse_episodes(html))
+    except: return []
+
+
+async def aload_series(hub_url, strict=False):
+    """
+    Loads a title page's seasons and its own episode list concurrently.
+    Both come from the same URL on single-season series, so the page is
+    fetched once and parsed twice.
+    """
+    try:
+        seasons, episodes = await get_catalog_cache().aget(
+            "series", hub_url, lambda html, url: (parse_seasons(html, url), parse_episodes(html))
+        )
+    except Exception:
+        if strict: raise
+        return [], []
+    return seasons, episodes
+
+
+async def aload_season_episodes(season_urls):
+    """Fetches the episode lists of several seasons concurrently, keyed by URL."""
+    lists = await asyncio.gather(*(afetch_episodes(url) for url in season_urls))
+    return dict(zip(season_urls, lists))
@@ -0,0 +1,218 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import threading
+import urllib.parse
+import httpx
+
+# Redis is optional; only needed when CATALOG_CACHE_URL points at one
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    from stream_scraper import http_client
+except ImportError:
+    import http_client
+
+# "redis://host:6379/0" shares the cache through Redis; otherwise a local SQLite file
+CACHE_URL = os.environ.get("CATALOG_CACHE_URL", "")
+CACHE_PATH = os.environ.get("CATALOG_CACHE_PATH", "/tmp/fasel_catalog_cache.sqlite")
+CACHE_TTL = int(os.environ.get("CATALOG_CACHE_TTL", "3600"))
+# How long past its TTL an entry may still be served while it is revalidated
+CACHE_MAX_STALE = int(os.environ.get("CATALOG_CACHE_MAX_STALE", "86400"))
+# One replica revalidates a key at a time; the lease expires if it dies mid-refresh
+REVALIDATE_LEASE = 60
+
+
+class SQLiteBackend:
+    """
+    Key/value store with per-key expiry in a local SQLite file, shared by the
+    processes of one host. Mirrors the subset of the Redis API the cache uses.
+    """
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+        self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM kv WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ex, nx=False):
+        """Stores value for `ex` seconds. With nx=True only if the key is absent; returns whether it was set."""
+        now = time.time()
+        with self._lock:
+            if nx:
+                self._db.execute("DELETE FROM kv WHERE key = ? AND expires <= ?", (key, now))
+                cur = self._db.execute("INSERT OR IGNORE INTO kv VALUES (?, ?, ?)", (key, value, now + ex))
+            else:
+                cur = self._db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, now + ex))
+            self._db.commit()
+            return cur.rowcount == 1
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE key = ?", (key,))
+            self._db.commit()
+
+
+class RedisBackend:
+    """Same interface on a Redis (or Redis-compatible) server, shared across hosts."""
+    def __init__(self, url=CACHE_URL):
+        if redis is None:
+            raise ImportError("CATALOG_CACHE_URL is a Redis URL but the 'redis' package is not installed")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ex, nx=False):
+        return bool(self._client.set(key, value, ex=int(max(1, ex)), nx=nx))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+
+def make_backend(url=CACHE_URL, path=CACHE_PATH):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    return SQLiteBackend(path)
+
+
+class CatalogCache:
+    """
+    Shared cache of parsed catalog pages (search results, seasons, episodes).
+
+    Entries keep the page's ETag / Last-Modified. Within CACHE_TTL they are
+    served as-is; after that they are still served (up to CACHE_MAX_STALE)
+    while one background refresh, leased across processes, revalidates them
+    with a conditional request. A 304 only bumps the entry's timestamp: the
+    page is neither downloaded again nor reparsed.
+    """
+    def __init__(self, backend=None, ttl=CACHE_TTL, max_stale=CACHE_MAX_STALE):
+        self.backend = backend or make_backend()
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "not_modified": 0, "refetched": 0}
+
+    @staticmethod
+    def key(kind, url, params=None):
+        if params:
+            url = f"{url}?{urllib.parse.urlencode(sorted(params.items()))}"
+        return f"catalog:{kind}:{url}"
+
+    def _load(self, key):
+        raw = self.backend.get(key)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _store(self, key, entry):
+        self.backend.set(key, json.dumps(entry, ensure_ascii=False), ex=self.ttl + self.max_stale)
+
+    def _entry(self, resp, data):
+        return {
+            "data": data,
+            "etag": resp.headers.get("etag"),
+            "last_modified": resp.headers.get("last-modified"),
+            "fetched": time.time(),
+        }
+
+    @staticmethod
+    def _conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _cached(self, key, url, parse, params):
+        """
+        Cached value for key, or None on a miss. Stale entries are returned
+        too, after starting their revalidation if no process holds the lease.
+        """
+        entry = self._load(key)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        if time.time() - entry["fetched"] < self.ttl:
+            self.counters["hits"] += 1
+            return entry
+        self.counters["stale_hits"] += 1
+        if self.backend.set(f"lease:{key}", "1", ex=REVALIDATE_LEASE, nx=True):
+            threading.Thread(target=self._revalidate, args=(key, url, parse, params, entry), daemon=True).start()
+        return entry
+
+    def _fetched(self, key, resp, parse):
+        # An error page is not the catalog: raise rather than parse it into an empty list
+        if resp.status_code != 200:
+            raise httpx.HTTPStatusError(f"HTTP {resp.status_code} for {resp.url}", request=resp.request, response=resp)
+        data = parse(resp.text, str(resp.url))
+        self._store(key, self._entry(resp, data))
+        return data
+
+    def _revalidate(self, key, url, parse, params, entry):
+        try:
+            resp = http_client.get(url, params=params, headers=self._conditional_headers(entry))
+            if resp.status_code == 304:
+                self.counters["not_modified"] += 1
+                self._store(key, dict(entry, fetched=time.time()))
+            elif resp.status_code == 200:
+                self.counters["refetched"] += 1
+                self._fetched(key, resp, parse)
+            else:
+                print(f"[CATALOG] Revalidation of {url} got HTTP {resp.status_code}, keeping stale entry")
+        except Exception as e:
+            print(f"[CATALOG] Revalidation failed for {url}: {e}")
+        finally:
+            self.backend.delete(f"lease:{key}")
+
+    def get(self, kind, url, parse, params=None):
+        """
+        Parsed page for url, from the cache when possible. parse(text, final_url)
+        turns a fetched page into the cached (JSON-serialisable) value.
+        """
+        key = self.key(kind, url, params)
+        entry = self._cached(key, url, parse, params)
+        if entry is not None:
+            return entry["data"]
+        return self._fetched(key, http_client.get(url, params=params), parse)
+
+    async def aget(self, kind, url, parse, params=None):
+        """
+        get() for the event loop; misses are fetched with the async client.
+        Backend reads and writes (SQLite, Redis) run in a worker thread.
+        """
+        key = self.key(kind, url, params)
+        entry = await asyncio.to_thread(self._cached, key, url, parse, params)
+        if entry is not None:
+            return entry["data"]
+        resp = await http_client.aget(url, params=params)
+        return await asyncio.to_thread(self._fetched, key, resp, parse)
+
+    def stats(self):
+        return dict(self.counters, backend=type(self.backend).__name__)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_catalog_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CatalogCache()
+        return _cache
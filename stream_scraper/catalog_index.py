@@ -0,0 +1,292 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import urllib.parse
+
+try:
+    from stream_scraper import catalog, http_client, mirrors
+except ImportError:
+    import catalog
+    import http_client
+    import mirrors
+
+INDEX_PATH = os.environ.get("CATALOG_INDEX_PATH", "/tmp/fasel_catalog.sqlite")
+# Listing sections crawled into the index, relative to the site base URL
+LISTINGS = [p.strip() for p in os.environ.get(
+    "CATALOG_LISTINGS", "/movies,/series,/asian-series,/anime,/tvshows"
+).split(",") if p.strip()]
+MAX_PAGES = int(os.environ.get("CATALOG_MAX_PAGES", "50"))
+# A delta crawl stops after this many consecutive listing pages with nothing new
+DELTA_STOP_PAGES = int(os.environ.get("CATALOG_DELTA_STOP_PAGES", "2"))
+REFRESH_INTERVAL = int(os.environ.get("CATALOG_REFRESH_INTERVAL", "3600"))
+SERIES_REFRESH = int(os.environ.get("CATALOG_SERIES_REFRESH", "21600"))
+
+# Arabic diacritics (tashkeel) and tatweel
+_ARABIC_MARKS_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_ARABIC_FOLDS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"})
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_text(text):
+    """
+    Folds a title for matching: lowercase Latin, Arabic without diacritics,
+    tatweel and letter-form variants (أ/إ/آ -> ا, ة -> ه, ى -> ي).
+    """
+    text = _ARABIC_MARKS_RE.sub("", text or "")
+    return text.translate(_ARABIC_FOLDS).lower()
+
+
+def _key(link):
+    # Site links are stored mirror-independent ("/path"), so a domain rotation keeps the index valid
+    return mirrors.get_mirror_resolver().relative(link)
+
+
+def _fts_query(query):
+    # Every token must match, each as a prefix; quoting keeps FTS syntax out of user input
+    tokens = _TOKEN_RE.findall(normalize_text(query))
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+class CatalogIndex:
+    """
+    Local SQLite FTS5 index of the catalog: titles (with thumbnails),
+    seasons and episode lists, filled by an incremental crawler. Links are
+    returned on the current mirror.
+    """
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS titles (
+                link TEXT PRIMARY KEY, title TEXT NOT NULL, img TEXT,
+                first_seen REAL NOT NULL, updated REAL NOT NULL, children_updated REAL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS titles_fts USING fts5(
+                link UNINDEXED, title, tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS seasons (
+                hub_link TEXT NOT NULL, position INTEGER NOT NULL, title TEXT, link TEXT NOT NULL,
+                PRIMARY KEY (hub_link, position)
+            );
+            CREATE TABLE IF NOT EXISTS episodes (
+                series_link TEXT NOT NULL, position INTEGER NOT NULL, title TEXT, link TEXT NOT NULL,
+                PRIMARY KEY (series_link, position)
+            );
+            CREATE TABLE IF NOT EXISTS crawled_pages (
+                link TEXT PRIMARY KEY, fetched REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    # --- Lookups ---
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+
+    def search(self, query, limit=30):
+        """Full-text title search. Returns [] when nothing matches."""
+        match = _fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT t.title, t.link, t.img FROM titles_fts f JOIN titles t ON t.link = f.link"
+                " WHERE titles_fts MATCH ? ORDER BY bm25(titles_fts) LIMIT ?",
+                (match, limit)
+            ).fetchall()
+        return [{"title": title, "link": mirrors.rewrite(link), "img": mirrors.rewrite(img)}
+                for title, link, img in rows]
+
+    def seasons(self, hub_url):
+        """Indexed seasons for a title, or None when the title was never crawled."""
+        with self._lock:
+            if not self._crawled(_key(hub_url)):
+                return None
+            rows = self._db.execute(
+                "SELECT title, link FROM seasons WHERE hub_link = ? ORDER BY position", (_key(hub_url),)
+            ).fetchall()
+        return [{"title": title, "link": mirrors.rewrite(link)} for title, link in rows]
+
+    def episodes(self, series_url):
+        """Indexed episode list for a series/season page, or None when never crawled."""
+        with self._lock:
+            if not self._crawled(_key(series_url)):
+                return None
+            rows = self._db.execute(
+                "SELECT title, link FROM episodes WHERE series_link = ? ORDER BY position", (_key(series_url),)
+            ).fetchall()
+        return [{"title": title, "link": mirrors.rewrite(link)} for title, link in rows]
+
+    def _crawled(self, link):
+        return self._db.execute("SELECT 1 FROM crawled_pages WHERE link = ?", (link,)).fetchone() is not None
+
+    # --- Writes ---
+
+    def upsert_titles(self, items):
+        """Adds or updates listing entries. Returns how many were new or changed."""
+        now = time.time()
+        changed = 0
+        with self._lock:
+            for item in items:
+                link, title, img = _key(item.get("link")), item.get("title"), _key(item.get("img"))
+                if not link or not title:
+                    continue
+                row = self._db.execute("SELECT title, img FROM titles WHERE link = ?", (link,)).fetchone()
+                if row == (title, img):
+                    continue
+                changed += 1
+                if row is None:
+                    self._db.execute(
+                        "INSERT INTO titles (link, title, img, first_seen, updated) VALUES (?, ?, ?, ?, ?)",
+                        (link, title, img, now, now)
+                    )
+                else:
+                    self._db.execute(
+                        "UPDATE titles SET title = ?, img = ?, updated = ? WHERE link = ?",
+                        (title, img, now, link)
+                    )
+                    self._db.execute("DELETE FROM titles_fts WHERE link = ?", (link,))
+                # Original and folded forms are both indexed so either spelling matches
+                self._db.execute("INSERT INTO titles_fts (link, title) VALUES (?, ?)",
+                                 (link, f"{title} {normalize_text(title)}"))
+            self._db.commit()
+        return changed
+
+    def store_children(self, page_url, seasons=None, episodes=None):
+        now = time.time()
+        page_url = _key(page_url)
+        with self._lock:
+            if seasons is not None:
+                self._db.execute("DELETE FROM seasons WHERE hub_link = ?", (page_url,))
+                self._db.executemany(
+                    "INSERT INTO seasons VALUES (?, ?, ?, ?)",
+                    [(page_url, i, s["title"], _key(s["link"])) for i, s in enumerate(seasons)]
+                )
+            if episodes is not None:
+                self._db.execute("DELETE FROM episodes WHERE series_link = ?", (page_url,))
+                self._db.executemany(
+                    "INSERT INTO episodes VALUES (?, ?, ?, ?)",
+                    [(page_url, i, e["title"], _key(e["link"])) for i, e in enumerate(episodes)]
+                )
+            self._db.execute("INSERT OR REPLACE INTO crawled_pages VALUES (?, ?)", (page_url, now))
+            self._db.execute("UPDATE titles SET children_updated = ? WHERE link = ?", (now, page_url))
+            self._db.commit()
+
+    def needs_refresh(self, link):
+        with self._lock:
+            row = self._db.execute("SELECT fetched FROM crawled_pages WHERE link = ?", (_key(link),)).fetchone()
+        return row is None or time.time() - row[0] > SERIES_REFRESH
+
+
+def _is_series(link):
+    path = urllib.parse.unquote(urllib.parse.urlsplit(link).path)
+    return any(marker in path for marker in ("seasons", "series", "season", "anime", "tvshows", "مسلسل"))
+
+
+class CatalogCrawler:
+    """
+    Incremental crawler: walks listing pages newest-first and stops once
+    DELTA_STOP_PAGES pages in a row bring nothing new, then refreshes the
+    seasons/episode lists of new or stale series.
+    """
+    def __init__(self, index, base_url=None):
+        self.index = index
+        # None follows the current mirror
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _listing_page(self, listing, page):
+        url = f"{self.base_url or mirrors.current_base()}{listing}"
+        if page > 1:
+            url = f"{url}/page/{page}"
+        resp = http_client.get(url)
+        if resp.status_code != 200:
+            return None
+        return catalog.parse_search_results(resp.text)
+
+    def crawl_listing(self, listing, max_pages=MAX_PAGES):
+        unchanged_pages = 0
+        series = []
+        for page in range(1, max_pages + 1):
+            if self._stop.is_set():
+                break
+            try:
+                items = self._listing_page(listing, page)
+            except Exception as e:
+                print(f"[INDEX] {listing} page {page} failed: {e}")
+                break
+            if not items:
+                break
+            changed = self.index.upsert_titles(items)
+            series.extend(i["link"] for i in items if _is_series(i["link"]))
+            unchanged_pages = 0 if changed else unchanged_pages + 1
+            if unchanged_pages >= DELTA_STOP_PAGES:
+                break
+        return series
+
+    def crawl_series(self, link):
+        """Indexes a title's seasons and the episode lists of the title page and each season."""
+        link = mirrors.rewrite(link)
+        # Strict fetches: a page that failed stays uncrawled (and retried next
+        # pass) instead of being stored as empty, which would hide the live site
+        seasons = catalog.fetch_seasons(link, strict=True)
+        self.index.store_children(link, seasons=seasons, episodes=catalog.fetch_episodes(link, strict=True))
+        for season in seasons:
+            if self._stop.is_set():
+                return
+            if self.index.needs_refresh(season["link"]):
+                season_url = mirrors.rewrite(season["link"])
+                try:
+                    episodes = catalog.fetch_episodes(season_url, strict=True)
+                except Exception as e:
+                    print(f"[INDEX] Episode crawl failed for {season_url}: {e}")
+                    continue
+                self.index.store_children(season_url, episodes=episodes)
+
+    def refresh(self):
+        """One delta pass over every listing."""
+        started = time.time()
+        before = self.index.count()
+        for listing in LISTINGS:
+            for link in self.crawl_listing(listing):
+                if self._stop.is_set():
+                    return
+                if self.index.needs_refresh(link):
+                    try:
+                        self.crawl_series(link)
+                    except Exception as e:
+                        print(f"[INDEX] Series crawl failed for {link}: {e}")
+        print(f"[INDEX] Refresh done in {time.time() - started:.0f}s: {self.index.count() - before} new title(s)")
+
+    def start_background(self, interval=REFRESH_INTERVAL):
+        """Runs refresh() now and then every `interval` seconds in a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"[INDEX] Refresh failed: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="catalog-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    import sys
+    base = sys.argv[1] if len(sys.argv) > 1 else None
+    index = CatalogIndex()
+    CatalogCrawler(index, base).refresh()
+    print(f"{index.count()} titles indexed in {index.path}")
@@ -0,0 +1,484 @@
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import uuid
+import urllib.parse
+
+# AES-128 playlists need the optional "cryptography" package
+try:
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    AES_AVAILABLE = True
+except ImportError:
+    AES_AVAILABLE = False
+
+try:
+    from stream_scraper import hls, http_client
+except ImportError:
+    import hls
+    import http_client
+
+DOWNLOAD_DIR = os.environ.get("HLS_DOWNLOAD_DIR", "downloads")
+DOWNLOAD_CONCURRENCY = int(os.environ.get("HLS_DOWNLOAD_CONCURRENCY", "8"))
+# Segments allowed ahead of the writer; bounds the reorder buffer's memory
+DOWNLOAD_WINDOW = int(os.environ.get("HLS_DOWNLOAD_WINDOW", "32"))
+SEGMENT_RETRIES = int(os.environ.get("HLS_SEGMENT_RETRIES", "4"))
+SEGMENT_TIMEOUT = float(os.environ.get("HLS_SEGMENT_TIMEOUT", "30"))
+# Downloads the API runs at once; further jobs wait in line
+MAX_DOWNLOAD_JOBS = int(os.environ.get("HLS_MAX_DOWNLOAD_JOBS", "2"))
+# Finished, failed and cancelled jobs stay pollable this long, and at most this many
+JOB_RETENTION = float(os.environ.get("HLS_JOB_RETENTION", "3600"))
+MAX_FINISHED_JOBS = int(os.environ.get("HLS_MAX_FINISHED_JOBS", "200"))
+PROGRESS_INTERVAL = 5
+# Resume checkpoints: the manifest is rewritten every this many segments or seconds
+MANIFEST_EVERY = int(os.environ.get("HLS_MANIFEST_EVERY", "16"))
+MANIFEST_INTERVAL = float(os.environ.get("HLS_MANIFEST_INTERVAL", "2"))
+
+
+class DownloadError(Exception):
+    """Raised when a playlist cannot be downloaded (bad playlist, segment that keeps failing, ...)."""
+    pass
+
+
+def parse_media_segments(text, base_url):
+    """
+    Lists a media playlist's segments in order, each with its absolute URL,
+    duration, media sequence number and the EXT-X-KEY in force. An
+    EXT-X-MAP init section comes first (once) as an extra segment.
+    """
+    segments = []
+    sequence = 0
+    duration = None
+    key = None
+    init = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line[8:].split(",", 1)[0] or 0)
+        elif line.startswith("#EXT-X-KEY:"):
+            attrs = hls.parse_attributes(line.split(":", 1)[1])
+            method = attrs.get("METHOD", "NONE")
+            if method == "NONE":
+                key = None
+            elif method == "AES-128":
+                key = {"uri": urllib.parse.urljoin(base_url, attrs["URI"]), "iv": attrs.get("IV")}
+            else:
+                raise DownloadError(f"Unsupported segment encryption: {method}")
+        elif line.startswith("#EXT-X-MAP:"):
+            uri = hls.parse_attributes(line.split(":", 1)[1]).get("URI")
+            if uri and init is None:
+                init = urllib.parse.urljoin(base_url, uri)
+                segments.append({"url": init, "duration": 0.0, "sequence": None, "key": key})
+        elif line.startswith("#EXT-X-BYTERANGE"):
+            raise DownloadError("Byte-range playlists are not supported")
+        elif not line.startswith("#"):
+            segments.append({"url": urllib.parse.urljoin(base_url, line), "duration": duration or 0.0,
+                             "sequence": sequence, "key": key})
+            sequence += 1
+            duration = None
+    return segments
+
+
+def _iv(key, sequence):
+    # Without an explicit IV, AES-128 uses the segment's media sequence number
+    if key.get("iv"):
+        return bytes.fromhex(key["iv"][2:] if key["iv"].lower().startswith("0x") else key["iv"])
+    return (sequence or 0).to_bytes(16, "big")
+
+
+def decrypt_segment(data, key_bytes, iv):
+    """AES-128-CBC with PKCS#7 padding, as HLS encrypts whole segments."""
+    decryptor = Cipher(algorithms.AES(key_bytes), modes.CBC(iv)).decryptor()
+    unpadder = padding.PKCS7(128).unpadder()
+    return unpadder.update(decryptor.update(data) + decryptor.finalize()) + unpadder.finalize()
+
+
+def choose_variant(variants, quality=None):
+    """
+    Picks a variant as parse_m3u8 lists them: the one whose height matches
+    `quality` ("720", "720p", "1280x720"), otherwise the highest bandwidth.
+    """
+    if not variants:
+        return None
+    ranked = sorted(variants, key=lambda v: v.get("bandwidth") or 0, reverse=True)
+    if quality:
+        height = str(quality).lower().rstrip("p").split("x")[-1]
+        for v in ranked:
+            if (v.get("resolution") or "").lower().split("x")[-1] == height:
+                return v
+    return ranked[0]
+
+
+class HLSDownload:
+    """
+    Downloads one media playlist into a single file.
+
+    Segments are fetched by a bounded pool of workers and handed to one writer
+    through a reorder buffer, so they land in playlist order while at most
+    `window` segments sit in memory. Every MANIFEST_EVERY segments (or
+    MANIFEST_INTERVAL seconds), and when the run stops early, a manifest next
+    to the output records how many segments and bytes are final; a new run
+    with the same output resumes from there. Writes, checkpoints and
+    decryption run in worker threads so the event loop (the API's, for
+    server-side jobs) never blocks on them.
+    """
+    def __init__(self, playlist_url, output, headers=None, concurrency=DOWNLOAD_CONCURRENCY,
+                 window=DOWNLOAD_WINDOW, on_progress=None):
+        self.playlist_url = playlist_url
+        self.output = output
+        self.manifest_path = output + ".manifest.json"
+        self.headers = dict(headers or {})
+        self.concurrency = max(1, concurrency)
+        self.window = max(self.concurrency, window)
+        self.on_progress = on_progress
+        self.total = 0
+        self.completed = 0
+        self.bytes = 0
+        self.resumed_from = 0
+        self.started = None
+        self.fetched_bytes = 0
+        self._keys = {}
+
+    # --- Manifest ---
+
+    def _load_manifest(self, total):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return 0, 0
+        # Playlist URLs carry expiring tokens; the segment count identifies the same video
+        if manifest.get("segments") != total or not os.path.exists(self.output):
+            return 0, 0
+        if os.path.getsize(self.output) < manifest.get("bytes", 0):
+            return 0, 0
+        return manifest["completed"], manifest["bytes"]
+
+    def _save_manifest(self):
+        manifest = {"playlist": self.playlist_url, "segments": self.total,
+                    "completed": self.completed, "bytes": self.bytes, "updated": time.time()}
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    # --- Progress ---
+
+    def progress(self):
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        rate = self.fetched_bytes / elapsed if elapsed > 0 else 0.0
+        done = self.completed - self.resumed_from
+        remaining = self.total - self.completed
+        eta = elapsed / done * remaining if done else None
+        return {
+            "segments": self.total,
+            "completed": self.completed,
+            "resumed_from": self.resumed_from,
+            "bytes": self.bytes,
+            "percent": round(100.0 * self.completed / self.total, 1) if self.total else 0.0,
+            "elapsed": round(elapsed, 1),
+            "bytes_per_second": round(rate),
+            "eta": round(eta, 1) if eta is not None else None,
+        }
+
+    # --- Fetching ---
+
+    async def _get(self, url):
+        last = None
+        for attempt in range(SEGMENT_RETRIES + 1):
+            try:
+                resp = await http_client.aget(url, retries=0, headers=self.headers, timeout=SEGMENT_TIMEOUT)
+                if resp.status_code == 200:
+                    return resp.content
+                last = f"HTTP {resp.status_code}"
+            except Exception as e:
+                last = str(e) or type(e).__name__
+            if attempt < SEGMENT_RETRIES:
+                await asyncio.sleep(http_client.BACKOFF * (2 ** attempt))
+        raise DownloadError(f"{url}: {last}")
+
+    async def _key(self, uri):
+        if uri not in self._keys:
+            self._keys[uri] = asyncio.ensure_future(self._get(uri))
+        return await self._keys[uri]
+
+    async def _segment(self, segment):
+        data = await self._get(segment["url"])
+        self.fetched_bytes += len(data)
+        if segment["key"]:
+            key_bytes = await self._key(segment["key"]["uri"])
+            data = await asyncio.to_thread(decrypt_segment, data, key_bytes, _iv(segment["key"], segment["sequence"]))
+        return data
+
+    # --- Run ---
+
+    @staticmethod
+    def _write(out, data):
+        out.write(data)
+        out.flush()
+
+    async def arun(self):
+        resp = await http_client.aget(self.playlist_url, headers=self.headers)
+        if resp.status_code != 200 or not resp.text.lstrip().startswith("#EXTM3U"):
+            raise DownloadError(f"Media playlist unavailable (HTTP {resp.status_code})")
+        if "#EXT-X-ENDLIST" not in resp.text:
+            raise DownloadError("Live playlists cannot be downloaded")
+        segments = parse_media_segments(resp.text, str(resp.url))
+        if not segments:
+            raise DownloadError("Media playlist lists no segments")
+        if any(s["key"] for s in segments) and not AES_AVAILABLE:
+            raise DownloadError("Playlist is AES-128 encrypted; install the 'cryptography' package")
+
+        self.total = len(segments)
+        self.completed, self.bytes = self._load_manifest(self.total)
+        self.resumed_from = self.completed
+        if self.completed:
+            print(f"[DOWNLOAD] Resuming {self.output} at segment {self.completed}/{self.total}")
+        os.makedirs(os.path.dirname(os.path.abspath(self.output)), exist_ok=True)
+        self.started = time.monotonic()
+
+        limiter = asyncio.Semaphore(self.concurrency)
+        slots = asyncio.Semaphore(self.window)
+        # Fetch tasks in playlist order: the reorder buffer
+        ordered = asyncio.Queue()
+        tasks = []
+
+        async def fetch(segment):
+            async with limiter:
+                return await self._segment(segment)
+
+        async def produce():
+            # Issued in order and only into free window slots: the writer's next
+            # segment is always already in flight, and the buffer stays bounded
+            for index in range(self.completed, self.total):
+                await slots.acquire()
+                task = asyncio.create_task(fetch(segments[index]))
+                tasks.append(task)
+                ordered.put_nowait(task)
+
+        producer = asyncio.create_task(produce())
+        last_report = 0.0
+        saved, last_save = self.completed, time.monotonic()
+        try:
+            with open(self.output, "r+b" if self.completed else "wb") as out:
+                out.truncate(self.bytes)
+                out.seek(self.bytes)
+                for index in range(self.completed, self.total):
+                    data = await (await ordered.get())
+                    await asyncio.to_thread(self._write, out, data)
+                    slots.release()
+                    self.completed = index + 1
+                    self.bytes += len(data)
+                    if self.completed - saved >= MANIFEST_EVERY or time.monotonic() - last_save >= MANIFEST_INTERVAL:
+                        await asyncio.to_thread(self._save_manifest)
+                        saved, last_save = self.completed, time.monotonic()
+                    if self.on_progress:
+                        self.on_progress(self.progress())
+                    if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                        last_report = time.monotonic()
+                        p = self.progress()
+                        print(f"[DOWNLOAD] {self.output}: {p['completed']}/{p['segments']} segments, "
+                              f"{p['bytes'] / 1e6:.1f} MB, {p['bytes_per_second'] / 1e6:.2f} MB/s")
+        except BaseException:
+            # Checkpoint what is already on disk so a rerun resumes from there
+            if self.completed > saved:
+                self._save_manifest()
+            raise
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(producer, *tasks, return_exceptions=True)
+
+        try:
+            os.remove(self.manifest_path)
+        except FileNotFoundError:
+            pass
+        result = dict(self.progress(), output=self.output)
+        print(f"[DOWNLOAD] Finished {self.output}: {result['bytes'] / 1e6:.1f} MB in {result['elapsed']}s")
+        return result
+
+    def run(self):
+        return http_client.run_sync(self.arun())
+
+
+async def adownload(master_url, output, headers=None, quality=None, **kwargs):
+    """
+    Downloads a stream given its master (or media) playlist: picks the variant
+    with choose_variant() and saves it to `output`. Returns the final progress.
+    """
+    resp = await http_client.aget(master_url, headers=headers)
+    if resp.status_code != 200:
+        raise DownloadError(f"Master playlist unavailable (HTTP {resp.status_code})")
+    variant = choose_variant(hls.parse_master(resp.text, str(resp.url))["variants"], quality)
+    playlist_url = variant["url"] if variant else str(resp.url)
+    if variant:
+        print(f"[DOWNLOAD] Variant {variant.get('resolution') or '?'} @ {variant.get('bandwidth') or '?'} bps")
+    result = await HLSDownload(playlist_url, output, headers, **kwargs).arun()
+    result["variant"] = variant.get("resolution") if variant else None
+    return result
+
+
+def output_name(episode_url, directory=DOWNLOAD_DIR):
+    """File name for an episode (or playlist) download, derived from the end of its URL path."""
+    parts = urllib.parse.unquote(urllib.parse.urlsplit(episode_url).path).rstrip("/").split("/")
+    slug = parts[-1]
+    if slug.endswith(".m3u8"):
+        # Playlists are usually all named master/index: keep the directory that tells them apart
+        slug = "_".join(parts[-2:])[:-5]
+    slug = re.sub(r"[^\w.-]+", "_", slug).strip("_") or "episode"
+    return os.path.join(directory, slug + ".ts")
+
+
+class DownloadManager:
+    """
+    Download jobs for the API: each job resolves its episode (or takes a
+    master playlist with headers), then downloads it. At most `max_jobs` run
+    at once; progress is kept per job for polling. Ended jobs are dropped
+    after JOB_RETENTION seconds, oldest first beyond MAX_FINISHED_JOBS.
+    """
+    ACTIVE = ("queued", "resolving", "downloading")
+
+    def __init__(self, resolve, directory=DOWNLOAD_DIR, max_jobs=MAX_DOWNLOAD_JOBS):
+        self.resolve = resolve
+        self.directory = directory
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self._limiter = None
+
+    def submit(self, episode_url=None, master_url=None, headers=None, quality=None):
+        """Queues a job on the running loop and returns its public state."""
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.max_jobs)
+        self._prune()
+        output = output_name(episode_url or master_url, self.directory)
+        for job in self.jobs.values():
+            # Two writers on one file would corrupt it; join the running job instead
+            if job["output"] == output and job["status"] in self.ACTIVE:
+                return self.public(job)
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "episode_url": episode_url,
+            "master_url": master_url,
+            "quality": quality,
+            "status": "queued",
+            "output": output,
+            "progress": None,
+            "error": None,
+            "created": time.time(),
+        }
+        self.jobs[job_id] = job
+        job["task"] = asyncio.create_task(self._run(job, headers))
+        return self.public(job)
+
+    async def _run(self, job, headers):
+        try:
+            async with self._limiter:
+                master_url = job["master_url"]
+                if not master_url:
+                    job["status"] = "resolving"
+                    result = await self.resolve(job["episode_url"])
+                    if not result or "error" in result:
+                        raise DownloadError((result or {}).get("error") or "Scraper returned no data.")
+                    master_url, headers = result["url"], result.get("headers")
+                job["status"] = "downloading"
+
+                def progress(p):
+                    job["progress"] = p
+
+                final = await adownload(master_url, job["output"], headers, job["quality"], on_progress=progress)
+                job.update(status="done", progress=final)
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            raise
+        except Exception as e:
+            job.update(status="failed", error=str(e) or type(e).__name__)
+            print(f"[DOWNLOAD] Job {job['id']} failed: {job['error']}")
+        finally:
+            job["finished"] = time.time()
+
+    def _prune(self):
+        ended = sorted((job for job in self.jobs.values() if job["status"] not in self.ACTIVE),
+                       key=lambda job: job.get("finished") or job["created"])
+        cutoff = time.time() - JOB_RETENTION
+        for i, job in enumerate(ended):
+            if i < len(ended) - MAX_FINISHED_JOBS or (job.get("finished") or job["created"]) < cutoff:
+                del self.jobs[job["id"]]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job and job["status"] in self.ACTIVE:
+            job["task"].cancel()
+        return job
+
+    @staticmethod
+    def public(job):
+        return {k: v for k, v in job.items() if k != "task"}
+
+    def stats(self):
+        self._prune()
+        states = [job["status"] for job in self.jobs.values()]
+        return {status: states.count(status) for status in set(states)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download an episode, a whole season or a playlist as .ts files.")
+    parser.add_argument("url", help="Episode page, season page (--season) or m3u8 playlist URL")
+    parser.add_argument("-o", "--output", help="Output file (single download only)")
+    parser.add_argument("-d", "--directory", default=DOWNLOAD_DIR, help="Output directory")
+    parser.add_argument("-q", "--quality", help="Variant height, e.g. 720 (default: best)")
+    parser.add_argument("--season", action="store_true", help="Download every episode of a season page")
+    parser.add_argument("--referer", help="Referer for a playlist URL")
+    parser.add_argument("-j", "--concurrency", type=int, default=DOWNLOAD_CONCURRENCY, help="Parallel segment fetches")
+    args = parser.parse_args(argv)
+
+    if ".m3u8" in args.url:
+        headers = {"Referer": args.referer} if args.referer else {}
+        output = args.output or output_name(args.url, args.directory)
+        http_client.run_sync(adownload(args.url, output, headers, args.quality, concurrency=args.concurrency))
+        return
+
+    try:
+        from stream_scraper import catalog, mirrors
+        from stream_scraper.resolver import resolve_stream
+    except ImportError:
+        import catalog
+        import mirrors
+        from resolver import resolve_stream
+
+    url = mirrors.rewrite(args.url)
+    episodes = [ep["link"] for ep in catalog.fetch_episodes(url)] if args.season else [url]
+    if not episodes:
+        parser.error(f"No episodes found on {url}")
+    failed = []
+    for number, episode in enumerate(episodes, 1):
+        print(f"[DOWNLOAD] Episode {number}/{len(episodes)}: {episode}")
+        output = args.output if args.output and len(episodes) == 1 else output_name(episode, args.directory)
+        result = resolve_stream(episode)
+        if not result or "error" in result:
+            print(f"[DOWNLOAD] Could not resolve {episode}: {(result or {}).get('error')}")
+            failed.append(episode)
+            continue
+        try:
+            http_client.run_sync(adownload(result["url"], output, result.get("headers"), args.quality,
+                                           concurrency=args.concurrency))
+        except DownloadError as e:
+            print(f"[DOWNLOAD] {episode}: {e} (rerun to resume)")
+            failed.append(episode)
+    if failed:
+        raise SystemExit(f"{len(failed)} of {len(episodes)} download(s) failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+# Major version of the installed Chrome; the chromedriver must match it
+CHROME_VERSION = int(os.environ.get("SCRAPER_CHROME_VERSION", "144"))
+# Where the build step leaves a patched chromedriver (baked into the image)
+DRIVER_PATH = os.environ.get(
+    "SCRAPER_DRIVER_PATH", os.path.join(os.path.expanduser("~"), ".cache", "fasel", "chromedriver")
+)
+# undetected_chromedriver marks the binaries it has patched with this string
+_PATCH_MARKER = b"undetected chromedriver"
+
+
+def is_patched(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read().find(_PATCH_MARKER) != -1
+    except OSError:
+        return False
+
+
+def prepared_driver(path=DRIVER_PATH):
+    """
+    Path of the pre-patched chromedriver when one exists, else None.
+    Passed to uc.Chrome it skips the per-container download and patching.
+    """
+    if os.path.isfile(path) and os.access(path, os.X_OK):
+        return path
+    return None
+
+
+def prepare_driver(path=DRIVER_PATH, version_main=CHROME_VERSION):
+    """
+    Downloads the chromedriver matching `version_main`, patches it and stores
+    it at `path`. Run once at image build time: python -m stream_scraper.driver
+    """
+    if prepared_driver(path) and is_patched(path):
+        print(f"[DRIVER] Patched chromedriver already at {path}")
+        return path
+    import undetected_chromedriver as uc
+
+    patcher = uc.Patcher(version_main=version_main)
+    patcher.auto()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    shutil.copy2(patcher.executable_path, tmp)
+    os.chmod(tmp, 0o755)
+    os.replace(tmp, path)
+    print(f"[DRIVER] Patched chromedriver {version_main} stored at {path}")
+    return path
+
+
+if __name__ == "__main__":
+    prepare_driver()
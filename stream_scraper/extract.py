@@ -0,0 +1,104 @@
+import re
+
+# Longest playlist URL kept across chunk boundaries; longer runs are dropped
+MAX_URL_BYTES = 4096
+SCAN_CHUNK_BYTES = 64 * 1024
+
+M3U8_BYTES_RE = re.compile(rb"""https?://[^"\s']+\.m3u8[^"\s']*""")
+# A URL never spans one of these, so a match can only continue past the last one
+_TERMINATORS = (b'"', b"'", b" ", b"\n", b"\r", b"\t")
+
+# Runs inside the page: only the candidate playlist URLs (stopping at the first
+# master) and the User-Agent cross the driver connection, never the whole DOM
+_PLAYLISTS_JS = r"""
+var re = /https?:\/\/[^"\s']+\.m3u8[^"\s']*/g;
+var html = document.documentElement ? document.documentElement.outerHTML : "";
+var urls = [], m;
+while ((m = re.exec(html)) !== null) {
+    if (urls.indexOf(m[0]) === -1) urls.push(m[0]);
+    if (m[0].indexOf("master") !== -1 || urls.length >= arguments[0]) break;
+}
+return {urls: urls, userAgent: navigator.userAgent};
+"""
+
+# The few elements find_player_urls() reads, instead of the full page source
+_SERVERS_JS = r"""
+var parts = [];
+document.querySelectorAll("iframe, .server--item").forEach(function (el) { parts.push(el.outerHTML); });
+return {html: parts.join("\n"), url: location.href, userAgent: navigator.userAgent};
+"""
+
+
+def pick_master(urls):
+    """The first URL naming a master playlist, else the first one (or None)."""
+    return next((u for u in urls if "master" in u), urls[0] if urls else None)
+
+
+def extract_playlists(driver, limit=20):
+    """
+    Searches the current page for m3u8 URLs inside the browser.
+    Returns (urls, user_agent); urls end at the first master match.
+    """
+    found = driver.execute_script(_PLAYLISTS_JS, limit) or {}
+    return found.get("urls") or [], found.get("userAgent")
+
+
+def extract_server_markup(driver):
+    """Returns (markup of the iframes and server buttons, page URL, user_agent) of the current page."""
+    found = driver.execute_script(_SERVERS_JS) or {}
+    return found.get("html") or "", found.get("url") or driver.current_url, found.get("userAgent")
+
+
+class MasterScanner:
+    """
+    Finds the master playlist URL in a response body fed chunk by chunk.
+
+    Only the current chunk plus a short carry-over (a URL or challenge
+    marker cut by the chunk boundary) is held, so memory does not grow with
+    the page. feed() returns True at the first master match, so the caller
+    can stop reading; challenge markers are noted along the way.
+    """
+    def __init__(self, markers=()):
+        self.markers = [m.encode() for m in markers]
+        self.overlap = max((len(m) for m in self.markers), default=1) - 1
+        self.master = None
+        self.first = None
+        self.challenged = False
+        self.scanned = 0
+        self._carry = b""
+
+    def feed(self, chunk, final=False):
+        data = self._carry + chunk
+        self.scanned += len(chunk)
+        if not self.challenged and any(m in data for m in self.markers):
+            self.challenged = True
+
+        pending = None
+        for match in M3U8_BYTES_RE.finditer(data):
+            if match.end() == len(data) and not final:
+                # May continue in the next chunk: rescan it from its start
+                pending = match.start()
+                break
+            url = match.group().decode("utf-8", "replace")
+            if "master" in url:
+                self.master = url
+                return True
+            if self.first is None:
+                self.first = url
+
+        if final:
+            self._carry = b""
+            return False
+        # Keep what a match or marker could still be completed from
+        if pending is None:
+            pending = max(data.rfind(t) for t in _TERMINATORS) + 1
+        start = max(min(pending, len(data) - self.overlap), len(data) - MAX_URL_BYTES, 0)
+        self._carry = data[start:]
+        return False
+
+    def finish(self):
+        self.feed(b"", final=True)
+        return self.result()
+
+    def result(self):
+        return self.master or self.first
@@ -0,0 +1,379 @@
+import os
+import time
+import queue
+import signal
+import threading
+import multiprocessing
+
+try:
+    from stream_scraper.pool import process_tree, process_tree_rss_mb, POOL_LEASE_TIMEOUT
+    from stream_scraper import metrics
+except ImportError:
+    from pool import process_tree, process_tree_rss_mb, POOL_LEASE_TIMEOUT
+    import metrics
+
+# Worker-fleet mode: SCRAPER_WORKERS > 0 runs browser scrapes in that many
+# separate processes, each with its own display and browser
+WORKERS = int(os.environ.get("SCRAPER_WORKERS", "0"))
+WORKER_JOB_TIMEOUT = float(os.environ.get("SCRAPER_WORKER_JOB_TIMEOUT", "150"))
+WORKER_MAX_RSS_MB = int(os.environ.get("SCRAPER_WORKER_MAX_RSS_MB", "900"))
+WORKER_MAX_JOBS = int(os.environ.get("SCRAPER_WORKER_MAX_JOBS", "50"))
+WORKER_START_TIMEOUT = float(os.environ.get("SCRAPER_WORKER_START_TIMEOUT", "120"))
+HEALTH_INTERVAL = float(os.environ.get("SCRAPER_WORKER_HEALTH_INTERVAL", "15"))
+HEALTH_TIMEOUT = 5
+# How often a waiting job checks whether its caller asked it to yield
+CANCEL_POLL_INTERVAL = 0.5
+
+
+class _PipeCancel:
+    """
+    Worker-side stand-in for the job's cancel Event: set once the API sends
+    ("cancel",). Only a cancel can arrive while a job runs, so polling the
+    pipe between scrape phases is enough.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self._set = False
+
+    def is_set(self):
+        if not self._set and self.conn.poll():
+            self._set = self.conn.recv()[0] == "cancel"
+        return self._set
+
+
+def _worker_main(conn, worker_id):
+    """
+    Worker process loop. Owns one warm browser (and its Xvfb display) and
+    answers ("job", url, request_id), ("session", url, request_id),
+    ("ping",) and ("stop",) messages. A ("cancel",) during a job preempts it.
+    """
+    if hasattr(os, "setsid"):
+        # Own process group, so a hard kill from the API also takes Chrome and Xvfb down
+        os.setsid()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        from stream_scraper.pool import BrowserPool
+        from stream_scraper.scraper import launch_browser, scrape_stream_app_mode, refresh_session
+        from stream_scraper.jobs import Preempted
+    except ImportError:
+        from pool import BrowserPool
+        from scraper import launch_browser, scrape_stream_app_mode, refresh_session
+        from jobs import Preempted
+    jobs = {"job": scrape_stream_app_mode, "session": refresh_session}
+
+    pool = BrowserPool(launch_browser, size=1)
+    pool.start()
+    conn.send(("ready", os.getpid()))
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break  # API process went away
+            kind = message[0]
+            if kind == "stop":
+                break
+            if kind == "cancel":
+                continue  # arrived just after its job had finished
+            if kind == "ping":
+                conn.send(("pong", pool.stats()))
+                continue
+            if kind in jobs:
+                _, url, rid = message
+                token = metrics.request_id.set(rid)
+                try:
+                    with metrics.collect_trace() as trace:
+                        try:
+                            kwargs = {"cancel": _PipeCancel(conn)} if kind == "job" else {}
+                            result = jobs[kind](url, pool=pool, **kwargs)
+                        except Preempted as e:
+                            result = {"error": str(e), "preempted": True}
+                        except Exception as e:
+                            result = {"error": str(e)}
+                    conn.send(("result", result, trace))
+                finally:
+                    metrics.request_id.reset(token)
+    finally:
+        pool.shutdown()
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class WorkerTimeout(Exception):
+    pass
+
+
+class Worker:
+    """Parent-side handle of one worker process."""
+    def __init__(self, worker_id, process, conn):
+        self.id = worker_id
+        self.process = process
+        self.conn = conn
+        self.jobs = 0
+        self.started_at = time.time()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def request(self, message, timeout, cancel=None):
+        """
+        Sends a message and waits for the reply. Raises WorkerTimeout or WorkerCrashed.
+        Once `cancel` (a threading.Event) is set, the worker is asked to stop the job.
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            self.conn.send(message)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.conn.poll(min(remaining, CANCEL_POLL_INTERVAL) if cancel is not None else remaining):
+                    return self.conn.recv()
+                if cancel is not None and cancel.is_set():
+                    self.conn.send(("cancel",))
+                    cancel = None
+        except (EOFError, OSError) as e:
+            raise WorkerCrashed(f"worker {self.id} died: {e}")
+        raise WorkerTimeout(f"worker {self.id} did not answer within {timeout:.0f}s")
+
+    def rss_mb(self):
+        return process_tree_rss_mb(self.pid)
+
+    def stop(self, grace=5):
+        """Asks the worker to quit, then kills its whole process tree."""
+        try:
+            self.conn.send(("stop",))
+        except Exception:
+            pass
+        self.process.join(grace)
+        self.kill()
+
+    def kill(self):
+        for pid in reversed(process_tree(self.pid)):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except Exception:
+                pass
+        if hasattr(os, "killpg") and self.process.is_alive():
+            try:
+                os.killpg(self.pid, signal.SIGKILL)
+            except Exception:
+                pass
+        self.process.join(1)
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class WorkerFleet:
+    """
+    Runs browser scrapes in N worker processes instead of the API process.
+
+    Each worker keeps one warm browser on its own display and serves one job
+    at a time over a local pipe. The fleet:
+    - hard-kills a worker (with its Chrome and Xvfb) whose job exceeds
+      `job_timeout`, and replaces it,
+    - replaces workers that crash, fail a health ping, pass `max_rss_mb`
+      (process tree RSS) or have served `max_jobs` jobs,
+    - starts replacements in the background so callers never wait for them.
+    """
+    def __init__(self, size=WORKERS, job_timeout=WORKER_JOB_TIMEOUT, max_rss_mb=WORKER_MAX_RSS_MB,
+                 max_jobs=WORKER_MAX_JOBS, health_interval=HEALTH_INTERVAL):
+        self.size = max(1, size)
+        self.job_timeout = job_timeout
+        self.max_rss_mb = max_rss_mb
+        self.max_jobs = max_jobs
+        self.health_interval = health_interval
+        # spawn: never fork a process that already runs the event loop and threads
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self._next_id = 0
+        self._closed = False
+        self._counters = {"jobs": 0, "timeouts": 0, "crashes": 0, "restarts": 0}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Starts the workers and the health monitor."""
+        print(f"[FLEET] Starting {self.size} worker(s)...")
+        threads = [threading.Thread(target=self._replenish, daemon=True) for _ in range(self.size)]
+        for t in threads:
+            t.start()
+        threading.Thread(target=self._monitor, name="fleet-health", daemon=True).start()
+        for t in threads:
+            t.join()
+
+    def shutdown(self):
+        print("[FLEET] Shutting down...")
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+            with self._lock:
+                self._live -= 1
+
+    def stats(self):
+        return dict(self._counters, size=self.size, live=self._live, idle=self._idle.qsize())
+
+    # --- Jobs ---
+
+    def run(self, url, timeout=None, cancel=None):
+        """
+        Scrapes `url` on an idle worker. Returns the scraper's result dict,
+        with "preempted" set when `cancel` stopped it.
+        """
+        return self._submit("job", url, timeout, cancel)
+
+    def refresh_session(self, url, timeout=None):
+        """Renews the stored browser session state for url's site on an idle worker."""
+        return self._submit("session", url, timeout)
+
+    def _submit(self, kind, url, timeout=None, cancel=None):
+        timeout = timeout or self.job_timeout
+        worker = None
+        deadline = time.monotonic() + POOL_LEASE_TIMEOUT
+        with metrics.span("worker_lease"):
+            # Short steps, so a job preempted while queued gives up its turn
+            while worker is None:
+                if cancel is not None and cancel.is_set():
+                    return {"error": "Preempted while waiting for a worker", "preempted": True}
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return {"error": "Worker fleet busy: no worker available"}
+                try:
+                    worker = self._idle.get(timeout=min(remaining, CANCEL_POLL_INTERVAL) if cancel is not None else remaining)
+                except queue.Empty:
+                    pass
+
+        self._counters["jobs"] += 1
+        try:
+            reply = worker.request((kind, url, metrics.request_id.get()), timeout, cancel)
+        except WorkerTimeout:
+            self._counters["timeouts"] += 1
+            self._replace(worker, f"job timed out after {timeout:.0f}s", kill=True)
+            return {"error": f"Scrape timed out after {timeout:.0f}s (worker killed)"}
+        except WorkerCrashed as e:
+            self._counters["crashes"] += 1
+            self._replace(worker, str(e), kill=True)
+            return {"error": f"Scrape worker crashed: {e}"}
+
+        _, result, trace = reply
+        metrics.merge_trace(trace)
+        worker.jobs += 1
+        self._check_in(worker)
+        return result
+
+    # --- Internals ---
+
+    def _check_in(self, worker):
+        reason = None
+        if self._closed:
+            reason = "fleet closed"
+        elif worker.jobs >= self.max_jobs:
+            reason = f"served {worker.jobs} jobs"
+        elif self.max_rss_mb:
+            rss = worker.rss_mb()
+            if rss > self.max_rss_mb:
+                reason = f"RSS {rss} MB > {self.max_rss_mb} MB"
+        if reason:
+            self._replace(worker, reason)
+        else:
+            self._idle.put(worker)
+
+    def _replace(self, worker, reason, kill=False):
+        print(f"[FLEET] Recycling worker {worker.id} (pid {worker.pid}): {reason}")
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+        with self._lock:
+            self._live -= 1
+        if not self._closed:
+            self._counters["restarts"] += 1
+            threading.Thread(target=self._replenish, daemon=True).start()
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._live < self.size:
+                self._live += 1
+                self._next_id += 1
+                return self._next_id
+            return None
+
+    def _replenish(self):
+        if self._closed:
+            return
+        worker_id = self._reserve_slot()
+        if worker_id is None:
+            return
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn, worker_id),
+                                    name=f"scrape-worker-{worker_id}", daemon=True)
+        process.start()
+        child_conn.close()
+        worker = Worker(worker_id, process, parent_conn)
+        try:
+            if not parent_conn.poll(WORKER_START_TIMEOUT):
+                raise TimeoutError(f"not ready within {WORKER_START_TIMEOUT:.0f}s")
+            parent_conn.recv()
+        except Exception as e:
+            print(f"[FLEET] Worker {worker_id} failed to start: {e}")
+            worker.kill()
+            with self._lock:
+                self._live -= 1
+            return
+        print(f"[FLEET] Worker {worker_id} ready (pid {worker.pid})")
+        self._idle.put(worker)
+
+    def _monitor(self):
+        """Pings idle workers every `health_interval` seconds and replaces unhealthy ones."""
+        while not self._closed:
+            time.sleep(self.health_interval)
+            checked = []
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                checked.append(worker)
+            for worker in checked:
+                if self._closed:
+                    self._idle.put(worker)
+                    continue
+                try:
+                    worker.request(("ping",), HEALTH_TIMEOUT)
+                except (WorkerTimeout, WorkerCrashed) as e:
+                    self._counters["crashes"] += 1
+                    self._replace(worker, f"health check failed: {e}", kill=True)
+                    continue
+                self._check_in(worker)
+            # Workers that never came up are retried here as well
+            if self._live < self.size:
+                threading.Thread(target=self._replenish, daemon=True).start()
+
+
+_fleet = None
+_fleet_lock = threading.Lock()
+
+
+def get_worker_fleet():
+    """
+    Returns the process-wide worker fleet, or None when scrapes run in-process
+    (SCRAPER_WORKERS=0, the default).
+    """
+    global _fleet
+    if WORKERS <= 0:
+        return None
+    with _fleet_lock:
+        if _fleet is None:
+            _fleet = WorkerFleet()
+        return _fleet
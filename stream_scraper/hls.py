@@ -0,0 +1,207 @@
+import os
+import re
+import time
+import asyncio
+import urllib.parse
+
+try:
+    from stream_scraper import http_client
+except ImportError:
+    import http_client
+
+PROBE_CONCURRENCY = int(os.environ.get("HLS_PROBE_CONCURRENCY", "6"))
+PROBE_TIMEOUT = float(os.environ.get("HLS_PROBE_TIMEOUT", "15"))
+# Media playlists are scanned line by line and abandoned past this size;
+# a master playlist larger than this is refused
+MAX_PLAYLIST_BYTES = int(os.environ.get("HLS_MAX_PLAYLIST_BYTES", str(8 * 1024 * 1024)))
+
+_ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(value):
+    """Parses an HLS attribute list (KEY=VALUE,KEY="quoted, value",...) into a dict."""
+    attrs = {}
+    for key, raw in _ATTRIBUTE_RE.findall(value):
+        attrs[key] = raw[1:-1] if raw.startswith('"') else raw
+    return attrs
+
+
+def _int(value):
+    try: return int(value)
+    except (TypeError, ValueError): return None
+
+
+def _float(value):
+    try: return float(value)
+    except (TypeError, ValueError): return None
+
+
+def parse_master(text, base_url):
+    """
+    Parses a master playlist. Returns {"variants": [...], "media": [...]}
+    where variants carry every EXT-X-STREAM-INF attribute and media lists
+    EXT-X-MEDIA audio/subtitle/closed-caption renditions.
+    """
+    variants = []
+    media = []
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            pending = {
+                "bandwidth": _int(attrs.get("BANDWIDTH")),
+                "average_bandwidth": _int(attrs.get("AVERAGE-BANDWIDTH")),
+                "resolution": attrs.get("RESOLUTION"),
+                "codecs": attrs.get("CODECS"),
+                "frame_rate": _float(attrs.get("FRAME-RATE")),
+                "audio": attrs.get("AUDIO"),
+                "subtitles": attrs.get("SUBTITLES"),
+                "closed_captions": attrs.get("CLOSED-CAPTIONS"),
+                "attributes": attrs,
+            }
+        elif line.startswith("#EXT-X-MEDIA:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            uri = attrs.get("URI")
+            media.append({
+                "type": attrs.get("TYPE"),
+                "group_id": attrs.get("GROUP-ID"),
+                "name": attrs.get("NAME"),
+                "language": attrs.get("LANGUAGE"),
+                "default": attrs.get("DEFAULT") == "YES",
+                "autoselect": attrs.get("AUTOSELECT") == "YES",
+                "url": urllib.parse.urljoin(base_url, uri) if uri else None,
+                "attributes": attrs,
+            })
+        elif not line.startswith("#") and pending is not None:
+            pending["url"] = urllib.parse.urljoin(base_url, line)
+            variants.append(pending)
+            pending = None
+    return {"variants": variants, "media": media}
+
+
+class MediaPlaylistScanner:
+    """
+    Incremental media playlist summarizer. Lines are fed one at a time and
+    only running totals are kept, so memory stays constant however long the
+    playlist is.
+    """
+    def __init__(self):
+        self.segments = 0
+        self.duration = 0.0
+        self.target_duration = None
+        self.media_sequence = None
+        self.playlist_type = None
+        self.endlist = False
+        self.encryption = set()
+
+    def feed(self, line):
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            self.duration += _float(line[8:].split(",", 1)[0]) or 0.0
+        elif line and not line.startswith("#"):
+            self.segments += 1
+        elif line.startswith("#EXT-X-TARGETDURATION:"):
+            self.target_duration = _int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            self.media_sequence = _int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-PLAYLIST-TYPE:"):
+            self.playlist_type = line.split(":", 1)[1]
+        elif line.startswith("#EXT-X-ENDLIST"):
+            self.endlist = True
+        elif line.startswith("#EXT-X-KEY:"):
+            method = parse_attributes(line.split(":", 1)[1]).get("METHOD", "NONE")
+            if method != "NONE":
+                self.encryption.add(method)
+
+    def summary(self):
+        return {
+            "segments": self.segments,
+            "duration": round(self.duration, 3),
+            "target_duration": self.target_duration,
+            "media_sequence": self.media_sequence,
+            "playlist_type": self.playlist_type,
+            "live": not self.endlist,
+            "encryption": sorted(self.encryption) or None,
+        }
+
+
+async def scan_media_playlist(url, headers=None):
+    """Streams a media playlist and returns its summary without buffering the body."""
+    scanner = MediaPlaylistScanner()
+    received = 0
+    client = http_client.get_async_client()
+    async with client.stream("GET", url, headers=headers) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            received += len(line) + 1
+            if received > MAX_PLAYLIST_BYTES:
+                result = scanner.summary()
+                result["truncated"] = True
+                return result
+            scanner.feed(line)
+    return scanner.summary()
+
+
+async def _read_master(url, headers=None):
+    """Streams a master playlist into memory, refusing one over MAX_PLAYLIST_BYTES. Returns (text, final_url)."""
+    chunks = []
+    received = 0
+    client = http_client.get_async_client()
+    async with client.stream("GET", url, headers=headers) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.aiter_bytes():
+            received += len(chunk)
+            if received > MAX_PLAYLIST_BYTES:
+                raise ValueError(f"Playlist larger than {MAX_PLAYLIST_BYTES} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks).decode(resp.encoding or "utf-8", errors="replace"), str(resp.url)
+
+
+async def aprobe(master_url, headers=None, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    """
+    Fetches a master playlist and every variant's media playlist concurrently.
+    Each variant gets a "media_playlist" summary (or "probe_error"); the whole
+    probe, master fetch included, is bounded by `timeout` seconds.
+    """
+    started = time.monotonic()
+    try:
+        text, final_url = await asyncio.wait_for(_read_master(master_url, headers), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Master playlist not received within {timeout:.0f}s")
+    master = parse_master(text, final_url)
+
+    if not master["variants"] and "#EXTINF" in text:
+        # Already a media playlist: describe it as a single variant
+        scanner = MediaPlaylistScanner()
+        for line in text.splitlines():
+            scanner.feed(line)
+        master["variants"].append({"url": final_url, "media_playlist": scanner.summary()})
+        return master
+
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def probe_one(variant):
+        async with limiter:
+            try:
+                variant["media_playlist"] = await scan_media_playlist(variant["url"], headers)
+            except Exception as e:
+                variant["probe_error"] = str(e) or type(e).__name__
+
+    remaining = max(0.1, timeout - (time.monotonic() - started))
+    tasks = [asyncio.create_task(probe_one(v)) for v in master["variants"]]
+    if tasks:
+        done, pending = await asyncio.wait(tasks, timeout=remaining)
+        for task in pending:
+            task.cancel()
+        for variant, task in zip(master["variants"], tasks):
+            if task in pending:
+                variant["probe_error"] = "timeout"
+    return master
+
+
+def probe(master_url, headers=None, **kwargs):
+    """Sync wrapper around aprobe() for non-async callers."""
+    return http_client.run_sync(aprobe(master_url, headers, **kwargs))
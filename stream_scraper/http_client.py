@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+import httpx
+
+try:
+    from stream_scraper.session import request_headers
+except ImportError:
+    from session import request_headers
+
+# HTTP/2 needs the optional "h2" package; fall back to HTTP/1.1 keep-alive without it
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+}
+TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+LIMITS = httpx.Limits(
+    max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.environ.get("HTTP_MAX_KEEPALIVE", "10")),
+    keepalive_expiry=60,
+)
+RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+RETRY_STATUSES = (429, 502, 503, 504)
+
+_client = None
+_client_lock = threading.Lock()
+# AsyncClients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_kwargs():
+    return {
+        "headers": DEFAULT_HEADERS,
+        "timeout": TIMEOUT,
+        "limits": LIMITS,
+        "http2": HTTP2,
+        "follow_redirects": True,
+    }
+
+
+def get_client():
+    """Process-wide pooled client: one TCP+TLS handshake per host, reused across calls."""
+    global _client
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(**_client_kwargs())
+        return _client
+
+
+def get_async_client():
+    """Pooled AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_kwargs())
+        _async_clients[loop] = client
+    return client
+
+
+def _should_retry(resp):
+    return resp.status_code in RETRY_STATUSES
+
+
+def get(url, retries=RETRIES, **kwargs):
+    """
+    GET through the shared client, retrying transient failures with exponential
+    backoff. Cookies and User-Agent from a stored browser session are sent along.
+    """
+    client = get_client()
+    kwargs["headers"] = request_headers(url, kwargs.get("headers"))
+    for attempt in range(retries + 1):
+        try:
+            resp = client.get(url, **kwargs)
+            if not _should_retry(resp) or attempt == retries:
+                return resp
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        time.sleep(BACKOFF * (2 ** attempt))
+
+
+async def aget(url, retries=RETRIES, **kwargs):
+    """Async counterpart of get()."""
+    client = get_async_client()
+    kwargs["headers"] = request_headers(url, kwargs.get("headers"))
+    for attempt in range(retries + 1):
+        try:
+            resp = await client.get(url, **kwargs)
+            if not _should_retry(resp) or attempt == retries:
+                return resp
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(BACKOFF * (2 ** attempt))
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coro, timeout=None):
+    """
+    Runs a coroutine on a long-lived background event loop and waits for it.
+    Keeping one loop alive lets its AsyncClient pool connections across calls
+    (e.g. across Streamlit reruns) instead of reconnecting every time.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="http-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result(timeout)
@@ -0,0 +1,238 @@
+import os
+import re
+import time
+import asyncio
+import urllib.parse
+import httpx
+from selectolax.parser import HTMLParser
+
+try:
+    from stream_scraper import http_client
+    from stream_scraper.servers import get_server_stats, record_attempt
+    from stream_scraper.session import request_headers
+    from stream_scraper.extract import MasterScanner, SCAN_CHUNK_BYTES
+except ImportError:
+    import http_client
+    from servers import get_server_stats, record_attempt
+    from session import request_headers
+    from extract import MasterScanner, SCAN_CHUNK_BYTES
+
+HTTP_TIMEOUT = float(os.environ.get("SCRAPER_HTTP_TIMEOUT", "10"))
+# SCRAPER_SERVER_RACE=0 tries player servers one at a time, in page order
+RACE_ENABLED = os.environ.get("SCRAPER_SERVER_RACE", "1") != "0"
+RACE_CONCURRENCY = int(os.environ.get("SCRAPER_RACE_CONCURRENCY", "4"))
+RACE_TIMEOUT = float(os.environ.get("SCRAPER_RACE_TIMEOUT", "20"))
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Accept-Language": "ar,en;q=0.8",
+}
+
+_URL_IN_JS_RE = re.compile(r"""['"](https?://[^'"]+|/[^'"]*video_player[^'"]*)['"]""")
+
+# Markers of an anti-bot interstitial that only a real browser can pass. Not
+# "challenge-platform": Cloudflare injects that beacon into ordinary pages too.
+CHALLENGE_MARKERS = ("cf-chl", "cf_chl_opt", "Just a moment...", "jschl")
+
+
+class EscalateToBrowser(Exception):
+    """Raised when the HTTP tier cannot answer and a browser is needed."""
+    pass
+
+
+def _check_challenge(resp):
+    if resp.status_code in (403, 429, 503):
+        raise EscalateToBrowser(f"HTTP {resp.status_code} from {resp.url}")
+    if any(marker in resp.text for marker in CHALLENGE_MARKERS):
+        raise EscalateToBrowser(f"JS challenge on {resp.url}")
+
+
+def find_player_urls(html, page_url):
+    """
+    Returns candidate player URLs from an episode page: the player_iframe /
+    video_player iframe first, then any URLs referenced by .server--item buttons.
+    """
+    tree = HTMLParser(html)
+    candidates = []
+
+    def add(url):
+        if not url:
+            return
+        url = urllib.parse.urljoin(page_url, url.strip())
+        if url not in candidates:
+            candidates.append(url)
+
+    for node in tree.css("iframe"):
+        src = node.attributes.get("src") or node.attributes.get("data-src")
+        if node.attributes.get("name") == "player_iframe" or (src and "video_player" in src):
+            add(src)
+
+    for node in tree.css(".server--item"):
+        for attr in ("data-url", "data-src", "data-link", "href"):
+            value = node.attributes.get(attr)
+            if value and value.startswith(("http", "/")):
+                add(value)
+        onclick = node.attributes.get("onclick") or ""
+        for match in _URL_IN_JS_RE.findall(onclick):
+            add(match)
+    return candidates
+
+
+def find_master(text):
+    """The master playlist URL in a page already in memory (see MasterScanner)."""
+    scanner = MasterScanner()
+    scanner.feed(text.encode(), final=True)
+    return scanner.result()
+
+
+async def _scan_player(player_url, headers):
+    """
+    Streams a player page through a MasterScanner and stops reading at the
+    first master URL, so large pages are never held in memory.
+    Returns (status_code, scanner).
+    """
+    scanner = MasterScanner(CHALLENGE_MARKERS)
+    client = http_client.get_async_client()
+    async with client.stream("GET", player_url, headers=request_headers(player_url, headers)) as resp:
+        if resp.status_code == 200:
+            async for chunk in resp.aiter_bytes(SCAN_CHUNK_BYTES):
+                if scanner.feed(chunk):
+                    break
+            else:
+                scanner.finish()
+    return resp.status_code, scanner
+
+
+def _scan_player_sync(client, player_url, headers):
+    """Blocking _scan_player() on the given client; raises EscalateToBrowser on a challenge."""
+    scanner = MasterScanner(CHALLENGE_MARKERS)
+    with client.stream("GET", player_url, headers=request_headers(player_url, dict(HTTP_HEADERS, **headers)),
+                       timeout=HTTP_TIMEOUT) as resp:
+        if resp.status_code in (403, 429, 503):
+            raise EscalateToBrowser(f"HTTP {resp.status_code} from {player_url}")
+        for chunk in resp.iter_bytes(SCAN_CHUNK_BYTES):
+            if scanner.feed(chunk):
+                break
+        else:
+            scanner.finish()
+    if scanner.challenged:
+        raise EscalateToBrowser(f"JS challenge on {player_url}")
+    return scanner
+
+
+async def _try_player(player_url, headers):
+    """Player page -> master URL -> master playlist check. Returns the master URL or None."""
+    status, scanner = await _scan_player(player_url, headers)
+    if status != 200 or scanner.challenged:
+        print(f"[RACE] {player_url}: player unusable (HTTP {status})")
+        return None
+    master = scanner.result()
+    if not master:
+        print(f"[RACE] {player_url}: no m3u8 in player page")
+        return None
+    playlist = await http_client.aget(master, retries=0, headers=dict(headers, Referer=player_url))
+    if playlist.status_code != 200 or not playlist.text.lstrip().startswith("#EXTM3U"):
+        print(f"[RACE] {player_url}: master playlist unusable (HTTP {playlist.status_code})")
+        return None
+    return master
+
+
+async def arace_players(player_urls, headers=None, concurrency=RACE_CONCURRENCY, timeout=RACE_TIMEOUT):
+    """
+    Resolves every candidate player concurrently and returns (player_url,
+    master_url) for the first one whose master playlist checks out, or None.
+    With limited concurrency the historically fastest servers start first.
+    Losers are cancelled; finished attempts feed the per-server stats.
+    """
+    if not player_urls:
+        return None
+    ordered = await asyncio.to_thread(get_server_stats().rank, player_urls)
+    limiter = asyncio.Semaphore(max(1, concurrency))
+    headers = dict(headers or {})
+
+    async def attempt(player_url):
+        async with limiter:
+            started = time.perf_counter()
+            try:
+                master = await _try_player(player_url, headers)
+            except asyncio.CancelledError:
+                record_attempt(player_url, False, cancelled=True)
+                raise
+            except Exception as e:
+                print(f"[RACE] {player_url}: {e}")
+                master = None
+            elapsed = time.perf_counter() - started
+            await asyncio.to_thread(record_attempt, player_url, master is not None, elapsed)
+            return (player_url, master) if master else None
+
+    tasks = [asyncio.create_task(attempt(url)) for url in ordered]
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=timeout):
+            won = await next_done
+            if won:
+                print(f"[RACE] Won by {won[0]}")
+                return won
+        return None
+    except asyncio.TimeoutError:
+        print(f"[RACE] No server answered within {timeout:.0f}s")
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def race_players(player_urls, headers=None, **kwargs):
+    """Blocking arace_players() for scraper threads (runs on the shared HTTP loop)."""
+    return http_client.run_sync(arace_players(player_urls, headers, **kwargs))
+
+
+def _result(master, player_url, user_agent):
+    headers = {"Referer": player_url, "User-Agent": user_agent}
+    curl_cmd = f"curl '{master}' -H 'Referer: {player_url}' -H 'User-Agent: {user_agent}'"
+    return {"url": master, "headers": headers, "curl": curl_cmd}
+
+
+def resolve_stream_http(target_url, client=None):
+    """
+    Browserless resolver: episode page -> player page -> m3u8 over plain HTTP.
+    Returns the same {"url", "headers", "curl"} dict as the browser scraper.
+    Raises EscalateToBrowser when the pages need a real browser. Transport
+    errors on the episode page itself are raised as-is: the mirror is down,
+    and a browser would not reach it either.
+    """
+    client = client or http_client.get_client()
+    resp = None
+    try:
+        print(f"[HTTP] Fetching episode page: {target_url}")
+        # A browser's stored clearance cookies often let plain HTTP through
+        resp = client.get(target_url, headers=request_headers(target_url, HTTP_HEADERS), timeout=HTTP_TIMEOUT)
+        _check_challenge(resp)
+        player_urls = find_player_urls(resp.text, str(resp.url))
+        print(f"[HTTP] Found {len(player_urls)} player candidate(s)")
+        if not player_urls:
+            raise EscalateToBrowser("No player iframe or server links in static HTML")
+
+        # Whatever UA the episode page was fetched with (a stored session's, if any)
+        user_agent = resp.request.headers.get("User-Agent", HTTP_HEADERS["User-Agent"])
+        if RACE_ENABLED:
+            won = race_players(player_urls, dict(HTTP_HEADERS, Referer=str(resp.url)))
+            if won:
+                return _result(won[1], won[0], user_agent)
+            raise EscalateToBrowser("No player server yielded a working master playlist")
+
+        for player_url in player_urls:
+            print(f"[HTTP] Fetching player page: {player_url}")
+            try:
+                master = _scan_player_sync(client, player_url, {"Referer": str(resp.url)}).result()
+            except httpx.HTTPError as e:
+                print(f"[HTTP] Player fetch failed: {e}")
+                continue
+            if master:
+                return _result(master, player_url, user_agent)
+        raise EscalateToBrowser("No m3u8 in player page markup")
+    except httpx.TransportError as e:
+        if resp is None:
+            raise
+        raise EscalateToBrowser(f"HTTP error: {e}")
+    except httpx.HTTPError as e:
+        raise EscalateToBrowser(f"HTTP error: {e}")
@@ -0,0 +1,241 @@
+import os
+import time
+import asyncio
+import functools
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from stream_scraper.pool import POOL_SIZE
+    from stream_scraper.fleet import WORKERS
+except ImportError:
+    from pool import POOL_SIZE
+    from fleet import WORKERS
+
+# Rough resident size of one Chrome scrape, used to size concurrency from free memory
+BROWSER_MEMORY_MB = int(os.environ.get("SCRAPER_BROWSER_MEMORY_MB", "350"))
+MAX_QUEUE = int(os.environ.get("SCRAPER_MAX_QUEUE", "20"))
+MAX_WAIT = float(os.environ.get("SCRAPER_MAX_WAIT", "60"))
+# Slots background (prefetch) jobs must always leave free for foreground requests
+BACKGROUND_RESERVE = int(os.environ.get("PREFETCH_RESERVE", "1"))
+
+
+class Saturated(Exception):
+    """Raised when a job cannot be queued or waited too long for a slot."""
+    pass
+
+
+class Preempted(Exception):
+    """Raised by a background job's worker once it was asked to yield to foreground work."""
+    pass
+
+
+def _available_memory_mb():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except Exception:
+        pass
+    return None
+
+
+def default_concurrency():
+    """
+    Number of scrapes allowed to run at once: SCRAPER_CONCURRENCY if set,
+    otherwise the worker fleet (or browser pool) size capped by what free
+    memory can hold.
+    """
+    configured = os.environ.get("SCRAPER_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    if WORKERS > 0:
+        limit = WORKERS
+    else:
+        limit = POOL_SIZE if POOL_SIZE > 0 else 2
+    memory = _available_memory_mb()
+    if memory:
+        limit = min(limit, max(1, memory // BROWSER_MEMORY_MB))
+    return max(1, limit)
+
+
+class JobScheduler:
+    """
+    Runs blocking scrape jobs off the event loop with:
+    - a global concurrency limit,
+    - a FIFO wait queue bounded by depth and wait time (Saturated when exceeded),
+    - single-flight coalescing: concurrent submits with the same key share one run,
+    - low-priority background jobs that only use spare slots. They get a
+      threading.Event as the `cancel` keyword and are asked to stop (set) as
+      soon as a foreground job has to wait.
+    """
+    def __init__(self, worker, concurrency=None, max_queue=MAX_QUEUE, max_wait=MAX_WAIT,
+                 background_reserve=BACKGROUND_RESERVE):
+        self.worker = worker
+        self.concurrency = concurrency or default_concurrency()
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.background_reserve = background_reserve
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="scrape")
+        self._active = 0
+        self._waiters = deque()
+        self._inflight = {}
+        self._background = {}
+        # Callers currently waiting on each job task
+        self._callers = {}
+        # Job tasks started as background work
+        self._background_tasks = set()
+        self.coalesced = 0
+        self.rejected = 0
+        self.preempted = 0
+        if self.concurrency <= self.background_reserve:
+            print(f"[JOBS] Background jobs (prefetch) disabled: concurrency {self.concurrency} "
+                  f"leaves no slot beyond PREFETCH_RESERVE={self.background_reserve}")
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "queued": len(self._waiters),
+            "inflight_keys": len(self._inflight),
+            "background": len(self._background),
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "preempted": self.preempted,
+        }
+
+    async def submit(self, key, *args, background=False, worker=None):
+        """
+        Runs worker(*args), sharing the result with other callers of the same key.
+        `worker` overrides the scheduler's default worker for this job.
+        Background submits never queue: they raise Saturated unless a spare slot
+        (beyond the foreground reserve) is free right now.
+
+        The job runs in a task owned by the scheduler and every caller only
+        waits on it, so a caller that is cancelled stops its own wait without
+        failing the job for the others. Once the last caller is gone, a job
+        still queued for a slot is dropped.
+        """
+        task = self._inflight.get(key)
+        if task is not None and not background:
+            self.coalesced += 1
+            print(f"[JOBS] Joining in-flight job for: {key}")
+            # A foreground caller now depends on it: exempt it from preemption
+            self._background.pop(key, None)
+            joined_background = task in self._background_tasks
+            try:
+                return await self._wait(task)
+            except (Preempted, Saturated):
+                # A background job that yielded, or found no spare slot, is no
+                # answer for a foreground caller: run it again (or join a rerun)
+                if not joined_background:
+                    raise
+                task = self._inflight.get(key)
+        if task is None:
+            task = self._start(key, args, background, worker or self.worker)
+        return await self._wait(task)
+
+    async def _wait(self, task):
+        self._callers[task] = self._callers.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._callers[task] -= 1
+            if not self._callers[task]:
+                del self._callers[task]
+                # Nobody wants the result any more. A job already on a thread
+                # keeps its slot until the thread returns (see _execute).
+                if not task.done():
+                    task.cancel()
+
+    def _start(self, key, args, background, worker):
+        job = self._run_background(key, worker, *args) if background else self._run(worker, *args)
+        task = asyncio.create_task(job)
+        self._inflight[key] = task
+        if background:
+            self._background_tasks.add(task)
+        task.add_done_callback(functools.partial(self._finished, key))
+        return task
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        self._background_tasks.discard(task)
+        # Mark retrieved so a failure nobody waits for any more is not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    async def _execute(self, worker):
+        """
+        Runs worker() on the executor in the current context (e.g. the request ID).
+        The slot taken for it is released only once the thread is done, even if
+        this coroutine is cancelled first.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self._executor, context.run, worker)
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.shield(future)
+
+    async def _run(self, worker, *args):
+        await self._acquire()
+        return await self._execute(functools.partial(worker, *args))
+
+    async def _run_background(self, key, worker, *args):
+        if self._waiters or self.concurrency - self._active <= self.background_reserve:
+            raise Saturated("No spare capacity for background work")
+        self._active += 1
+        cancel = threading.Event()
+        self._background[key] = cancel
+        try:
+            return await self._execute(functools.partial(worker, *args, cancel=cancel))
+        finally:
+            self._background.pop(key, None)
+
+    def _preempt_background(self):
+        for key, cancel in list(self._background.items()):
+            if not cancel.is_set():
+                print(f"[JOBS] Preempting background job: {key}")
+                cancel.set()
+                self.preempted += 1
+
+    async def _acquire(self):
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Saturated(f"Queue full ({self.max_queue} waiting)")
+        self._preempt_background()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Slot was handed over just as we timed out; give it back
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+            self.rejected += 1
+            raise Saturated(f"Waited {time.monotonic() - started:.0f}s for a free slot")
+        except asyncio.CancelledError:
+            if waiter.done():
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self):
+        # Hand the slot directly to the oldest waiter so arrivals cannot jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# LOG_FORMAT=json emits one structured line per span/outcome alongside the usual prints
+JSON_LOGS = os.environ.get("LOG_FORMAT", "text") == "json"
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+request_id = contextvars.ContextVar("request_id", default=None)
+_trace = contextvars.ContextVar("trace", default=None)
+
+_registry = []
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._render_values())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_values(self):
+        return [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _render_values(self):
+        return [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observed = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, observed + 1)
+
+    def _render_values(self):
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total, observed) in self._values.items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_label_str(names, key + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_label_str(names, key + ('+Inf',))} {observed}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {observed}")
+        return lines
+
+
+def render():
+    """Prometheus text exposition of every registered metric."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Scraper metrics ---
+
+PHASE_SECONDS = Histogram("scraper_phase_seconds", "Time spent in each scrape phase.", ["phase"])
+SCRAPE_SECONDS = Histogram("scraper_duration_seconds", "End-to-end resolve time.", ["tier", "outcome"])
+OUTCOMES = Counter("scraper_outcomes_total", "Resolve outcomes by tier and fallback path.", ["tier", "outcome", "path"])
+
+
+def log_event(event, **fields):
+    if not JSON_LOGS:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, "request_id": request_id.get()}
+    record.update(fields)
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
+@contextmanager
+def span(phase):
+    """Times a scrape phase into scraper_phase_seconds{phase=...}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        PHASE_SECONDS.observe(elapsed, phase=phase)
+        trace = _trace.get()
+        if trace is not None:
+            trace["phases"][phase] = round(trace["phases"].get(phase, 0) + elapsed, 4)
+        log_event("span", phase=phase, seconds=round(elapsed, 4))
+
+
+def annotate(**fields):
+    """Attaches details (e.g. which fallback path was taken) to the current scrape trace."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+@contextmanager
+def collect_trace():
+    """
+    Collects spans and annotations without recording an outcome. Used in fleet
+    workers, whose trace is merged into the API process's scrape trace.
+    """
+    trace = {"phases": {}}
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def merge_trace(collected):
+    """Folds a trace collected in another process into the metrics and the current trace."""
+    collected = dict(collected or {})
+    for phase, seconds in collected.pop("phases", {}).items():
+        PHASE_SECONDS.observe(seconds, phase=phase)
+        trace = _trace.get()
+        if trace is not None:
+            trace["phases"][phase] = round(trace["phases"].get(phase, 0) + seconds, 4)
+    annotate(**collected)
+
+
+def classify(result):
+    """Maps a resolver result to an outcome label."""
+    if not result:
+        return "error"
+    error = result.get("error")
+    if not error:
+        return "success"
+    lowered = error.lower()
+    if "player not found" in lowered:
+        return "no-player"
+    if "no m3u8" in lowered:
+        return "no-m3u8"
+    if "timeout" in lowered or "timed out" in lowered:
+        return "timeout"
+    return "error"
+
+
+@contextmanager
+def trace_scrape(url):
+    """
+    Collects phases and annotations for one resolve. On exit the outcome is
+    counted and, with JSON logs on, one summary line is written.
+    """
+    trace = {"url": url, "phases": {}, "tier": None, "player_path": None, "extraction": None, "result": None}
+    token = _trace.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        elapsed = time.perf_counter() - started
+        outcome = trace.get("outcome") or classify(trace["result"])
+        tier = trace["tier"] or "none"
+        # e.g. "iframe/network" or "server-button/source"
+        path = "/".join(p for p in (trace["player_path"], trace["extraction"]) if p) or "none"
+        SCRAPE_SECONDS.observe(elapsed, tier=tier, outcome=outcome)
+        OUTCOMES.inc(tier=tier, outcome=outcome, path=path)
+        log_event("scrape", url=url, tier=tier, outcome=outcome, path=path,
+                  seconds=round(elapsed, 4), phases=trace["phases"])
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import urllib.parse
+import httpx
+
+try:
+    from stream_scraper import http_client
+except ImportError:
+    import http_client
+
+# Candidate site domains, preferred first. The site rotates domains; list new
+# ones here (or let the prober discover them through redirects).
+MIRRORS = [m.strip().rstrip("/") for m in os.environ.get(
+    "FASEL_MIRRORS", "https://web12818x.faselhdx.bid"
+).split(",") if m.strip()]
+MIRROR_STATE_PATH = os.environ.get("FASEL_MIRROR_STATE_PATH", "/tmp/fasel_mirror.json")
+PROBE_INTERVAL = int(os.environ.get("FASEL_MIRROR_PROBE_INTERVAL", "300"))
+PROBE_TIMEOUT = float(os.environ.get("FASEL_MIRROR_PROBE_TIMEOUT", "5"))
+# Discovered (redirect target) mirrors not seen answering for this long are dropped
+CANDIDATE_MAX_AGE = int(os.environ.get("FASEL_MIRROR_MAX_AGE", "86400"))
+
+
+def _base(url):
+    parts = urllib.parse.urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class MirrorResolver:
+    """
+    Keeps the fastest reachable site mirror.
+
+    Candidates are probed in the background (GET / without following
+    redirects). A 200, or a redirect within the same host, counts as live
+    with its latency; a redirect to a new host adds that host as a
+    candidate, which is how domain rotations are picked up. Discovered hosts that stop answering for CANDIDATE_MAX_AGE
+    are dropped again. The choice is persisted so restarts skip the probe
+    (unless the configured list has changed since), and mark_down() fails
+    over to the next live mirror immediately.
+    """
+    def __init__(self, candidates=None, state_path=MIRROR_STATE_PATH):
+        self.state_path = state_path
+        self.configured = list(dict.fromkeys(_base(c) for c in (candidates or MIRRORS)))
+        self.candidates = list(self.configured)
+        self.latency = {}
+        # Last time each discovered candidate answered (200 or redirect)
+        self.seen = {}
+        self._current = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._load()
+
+    # --- Choice ---
+
+    def current(self):
+        """Base URL of the mirror to use now (no trailing slash)."""
+        with self._lock:
+            return self._current or self.candidates[0]
+
+    def mark_down(self, base):
+        """Drops a failing mirror and switches to the next fastest live one (re-probing if none)."""
+        base = _base(base)
+        with self._lock:
+            self.latency.pop(base, None)
+            if self._current == base:
+                self._current = None
+            remaining = bool(self.latency)
+        print(f"[MIRROR] {base} marked down")
+        if remaining:
+            self._choose()
+        else:
+            self.probe()
+        return self.current()
+
+    def stats(self):
+        with self._lock:
+            return {"current": self._current, "candidates": list(self.candidates),
+                    "latency_ms": {b: round(s * 1000, 1) for b, s in self.latency.items()}}
+
+    # --- Links ---
+
+    def is_mirror(self, url):
+        # Only configured and discovered mirrors: CDN and image hosts of the
+        # site must keep their own domain
+        if not urllib.parse.urlsplit(url).netloc:
+            return False
+        return _base(url) in self.candidates
+
+    def relative(self, url):
+        """Strips the mirror host from a site link ("/path?query"); other URLs pass through."""
+        if not url or not self.is_mirror(url):
+            return url
+        parts = urllib.parse.urlsplit(url)
+        return urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, parts.fragment))
+
+    def absolute(self, link):
+        """Puts a site link (relative, or on any mirror) onto the current mirror."""
+        if not link:
+            return link
+        if link.startswith("/") and not link.startswith("//"):
+            return self.current() + link
+        if self.is_mirror(link):
+            return self.current() + self.relative(link)
+        return link
+
+    # --- Probing ---
+
+    async def _probe_one(self, client, base):
+        started = time.perf_counter()
+        try:
+            resp = await client.get(base + "/", follow_redirects=False, timeout=PROBE_TIMEOUT)
+        except httpx.HTTPError as e:
+            return base, None, None, str(e)
+        elapsed = time.perf_counter() - started
+        location = resp.headers.get("location") if resp.is_redirect else None
+        redirect = _base(urllib.parse.urljoin(base + "/", location)) if location else None
+        if redirect == base:
+            # "/" redirecting to another path on the same host (e.g. /home) is a live answer
+            return base, elapsed, None, resp.status_code
+        return base, (elapsed if resp.status_code == 200 else None), redirect, resp.status_code
+
+    async def aprobe(self):
+        """Probes every candidate concurrently, following redirects to new domains."""
+        client = http_client.get_async_client()
+        pending = list(self.candidates)
+        probed = set()
+        latency = {}
+        answered = set()
+        while pending:
+            batch = [b for b in dict.fromkeys(pending) if b not in probed]
+            probed.update(batch)
+            pending = []
+            for base, elapsed, redirect, status in await asyncio.gather(*(self._probe_one(client, b) for b in batch)):
+                if elapsed is not None:
+                    latency[base] = elapsed
+                    answered.add(base)
+                elif redirect and redirect != base:
+                    print(f"[MIRROR] {base} redirects to {redirect}")
+                    answered.add(base)
+                    with self._lock:
+                        if redirect not in self.candidates:
+                            self.candidates.append(redirect)
+                            self.seen[redirect] = time.time()
+                    pending.append(redirect)
+                else:
+                    print(f"[MIRROR] {base} unavailable: {status}")
+        now = time.time()
+        with self._lock:
+            self.latency = latency
+            self.seen.update(dict.fromkeys(answered, now))
+            for base in [b for b in self.candidates if b not in self.configured]:
+                if now - self.seen.get(base, 0) > CANDIDATE_MAX_AGE:
+                    print(f"[MIRROR] Dropping {base}: not seen for {CANDIDATE_MAX_AGE}s")
+                    self.candidates.remove(base)
+                    self.seen.pop(base, None)
+        self._choose()
+        return latency
+
+    def probe(self):
+        return http_client.run_sync(self.aprobe())
+
+    def _choose(self):
+        with self._lock:
+            if self.latency:
+                best = min(self.latency, key=self.latency.get)
+                if best != self._current:
+                    print(f"[MIRROR] Using {best} ({self.latency[best] * 1000:.0f} ms)")
+                self._current = best
+            else:
+                # Nothing answered: fall back to the preferred candidate, not a dead choice
+                self._current = None
+        self._save()
+
+    def start_background(self, interval=PROBE_INTERVAL):
+        """Probes now and then every `interval` seconds in a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.probe()
+                except Exception as e:
+                    print(f"[MIRROR] Probe failed: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="mirror-probe", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- Persistence ---
+
+    def _load(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("configured") != self.configured:
+            # FASEL_MIRRORS changed since the state was saved: it takes precedence
+            print("[MIRROR] Configured mirrors changed, ignoring saved state")
+            return
+        now = time.time()
+        for base, seen in state.get("seen", {}).items():
+            if base not in self.candidates and now - seen <= CANDIDATE_MAX_AGE:
+                self.candidates.append(base)
+                self.seen[base] = seen
+        if state.get("current") in self.candidates:
+            self._current = state["current"]
+
+    def _save(self):
+        with self._lock:
+            state = {"current": self._current, "configured": self.configured, "candidates": self.candidates,
+                     "seen": self.seen, "saved": time.time()}
+        try:
+            tmp = f"{self.state_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"[MIRROR] Could not save state: {e}")
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_mirror_resolver():
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = MirrorResolver()
+        return _resolver
+
+
+def current_base():
+    return get_mirror_resolver().current()
+
+
+def rewrite(url):
+    """Moves a site link onto the current mirror; non-site URLs are returned unchanged."""
+    return get_mirror_resolver().absolute(url)
+
+
+def with_failover(call, attempts=2):
+    """
+    Runs call(base_url) against the current mirror. On a transport error the
+    mirror is marked down and the call is retried on the next one, so the
+    call must let httpx.TransportError through.
+    """
+    resolver = get_mirror_resolver()
+    for attempt in range(attempts):
+        base = resolver.current()
+        try:
+            return call(base)
+        except httpx.TransportError:
+            if attempt == attempts - 1:
+                raise
+            resolver.mark_down(base)
+
+
+def fetch_on_mirror(url, fetch, attempts=2):
+    """
+    with_failover() for a site link: runs fetch(url) with the link moved onto
+    the current mirror, and onto the next one if that mirror is down.
+    Other URLs are fetched once, as given.
+    """
+    resolver = get_mirror_resolver()
+    if not resolver.is_mirror(url):
+        return fetch(url)
+    path = resolver.relative(url)
+    return with_failover(lambda base: fetch(base + path), attempts)
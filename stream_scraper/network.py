@@ -0,0 +1,117 @@
+import os
+import json
+import time
+
+# "network" captures the playlist request over CDP, "source" only scans page markup
+CAPTURE_MODE = os.environ.get("SCRAPER_CAPTURE_MODE", "network")
+CAPTURE_POLL = float(os.environ.get("SCRAPER_CAPTURE_POLL", "0.1"))
+
+# Images, media segments and fonts are never needed to find the playlist
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.ts", "*.m4s", "*.aac", "*.mp3",
+]
+
+AD_DOMAINS = [
+    "doubleclick.net", "googlesyndication.com", "google-analytics.com",
+    "googletagmanager.com", "adservice.google.com", "popads.net",
+    "propellerads.com", "adsterra.com", "exoclick.com", "juicyads.com",
+    "onclickads.net", "hilltopads.net", "a-ads.com", "mgid.com",
+]
+# Extra comma-separated ad hosts can be supplied without a code change
+AD_DOMAINS += [d.strip() for d in os.environ.get("SCRAPER_AD_DOMAINS", "").split(",") if d.strip()]
+
+
+def capture_enabled():
+    return CAPTURE_MODE == "network"
+
+
+def add_capture_options(options):
+    """Turns on Chrome performance logging so CDP network events can be read back."""
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+
+def _drain(driver):
+    try:
+        return driver.get_log("performance")
+    except Exception:
+        return []
+
+
+def start_capture(driver):
+    """
+    Enables the Network domain, installs the block list and discards any
+    events buffered so far (e.g. from a previous lease or page).
+    """
+    patterns = BLOCKED_URL_PATTERNS + [f"*{domain}*" for domain in AD_DOMAINS]
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception as e:
+        print(f"[CAPTURE] Could not configure network domain: {e}")
+    _drain(driver)
+
+
+def _clean_headers(headers):
+    # HTTP/2 pseudo headers (":authority", ...) are not valid for replay
+    return {k: v for k, v in (headers or {}).items() if not k.startswith(":")}
+
+
+def wait_for_playlist_request(driver, timeout):
+    """
+    Polls CDP network events until the page requests an .m3u8 playlist.
+    Returns {"url", "headers"} for the first master playlist (or the first
+    playlist seen if none is named master), or None on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    requests = {}
+    extra_headers = {}
+    first = None
+    while time.monotonic() < deadline:
+        for entry in _drain(driver):
+            try:
+                message = json.loads(entry["message"])["message"]
+            except Exception:
+                continue
+            method = message.get("method")
+            params = message.get("params", {})
+            if method == "Network.requestWillBeSent":
+                request = params.get("request", {})
+                url = request.get("url", "")
+                if ".m3u8" in url:
+                    requests[params.get("requestId")] = {"url": url, "headers": request.get("headers", {})}
+                    if first is None:
+                        first = params.get("requestId")
+                    if "master" in url:
+                        first = params.get("requestId")
+            elif method == "Network.requestWillBeSentExtraInfo":
+                extra_headers[params.get("requestId")] = params.get("headers", {})
+
+        if first is not None:
+            # Give the ExtraInfo event (the real wire headers) one more poll to arrive
+            if first not in extra_headers:
+                time.sleep(CAPTURE_POLL)
+                for entry in _drain(driver):
+                    try:
+                        message = json.loads(entry["message"])["message"]
+                    except Exception:
+                        continue
+                    if message.get("method") == "Network.requestWillBeSentExtraInfo":
+                        params = message.get("params", {})
+                        extra_headers[params.get("requestId")] = params.get("headers", {})
+            captured = requests[first]
+            headers = _clean_headers(captured["headers"])
+            headers.update(_clean_headers(extra_headers.get(first)))
+            return {"url": captured["url"], "headers": headers}
+        time.sleep(CAPTURE_POLL)
+    return None
+
+
+def get_header(headers, name):
+    """Case-insensitive header lookup (HTTP/2 wire headers are lowercase)."""
+    name = name.lower()
+    for k, v in (headers or {}).items():
+        if k.lower() == name:
+            return v
+    return None
@@ -0,0 +1,258 @@
+import os
+import sys
+import time
+import queue
+import threading
+import urllib.parse
+from contextlib import contextmanager
+
+# Pool tuning (overridable from the environment)
+POOL_SIZE = int(os.environ.get("SCRAPER_POOL_SIZE", "2"))
+POOL_MAX_JOBS = int(os.environ.get("SCRAPER_POOL_MAX_JOBS", "25"))
+POOL_MAX_RSS_MB = int(os.environ.get("SCRAPER_POOL_MAX_RSS_MB", "700"))
+POOL_LEASE_TIMEOUT = float(os.environ.get("SCRAPER_POOL_LEASE_TIMEOUT", "120"))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PooledBrowser:
+    """
+    A Chrome driver together with the Xvfb display it was started on.
+    """
+    def __init__(self, driver, display=None):
+        self.driver = driver
+        self.display = display
+        self.jobs = 0
+        self.created_at = time.time()
+
+    def quit(self):
+        if self.driver:
+            try: self.driver.quit()
+            except: pass
+        if self.display:
+            try: self.display.stop()
+            except: pass
+        self.driver = None
+        self.display = None
+
+
+def process_tree(pid):
+    """
+    Returns pid and the pids of all its descendants using /proc (Linux only).
+    """
+    if not pid or not sys.platform.startswith("linux"):
+        return []
+    found = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        if current in found:
+            continue
+        found.append(current)
+        try:
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pending.extend(int(c) for c in f.read().split())
+        except Exception:
+            pass
+    return found
+
+
+def process_tree_rss_mb(pid):
+    """
+    Sums VmRSS for a process and all of its descendants.
+    Returns 0 when the information is not available.
+    """
+    total_kb = 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except Exception:
+            continue
+    return total_kb // 1024
+
+
+class BrowserPool:
+    """
+    Keeps a fixed number of warm Chrome sessions and leases them to scrape jobs.
+
+    Browsers are reset (tabs, cookies, storage) between leases and recycled
+    once they have served `max_jobs` jobs, exceed `max_rss_mb` or fail a
+    health check. Replacements are launched in the background so the caller
+    returning a browser never waits for a cold start.
+    """
+    def __init__(self, launcher, size=POOL_SIZE, max_jobs=POOL_MAX_JOBS, max_rss_mb=POOL_MAX_RSS_MB):
+        self.launcher = launcher
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._launch_lock = threading.Lock()
+        self._live = 0
+        self._closed = False
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Pre-launches browsers until the pool is full."""
+        print(f"[POOL] Warming {self.size} browser(s)...")
+        for _ in range(self.size):
+            self._replenish()
+
+    def shutdown(self):
+        print("[POOL] Shutting down...")
+        self._closed = True
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._dispose(browser)
+
+    def stats(self):
+        return {"size": self.size, "live": self._live, "idle": self._idle.qsize()}
+
+    # --- Leasing ---
+
+    @contextmanager
+    def lease(self, timeout=POOL_LEASE_TIMEOUT):
+        browser = self.acquire(timeout)
+        try:
+            yield browser
+        finally:
+            self.release(browser)
+
+    def acquire(self, timeout=POOL_LEASE_TIMEOUT):
+        """Takes a healthy browser out of the pool; pair with release()."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                browser = None
+                if self._reserve_slot():
+                    # Pool not full yet: launch inline for this caller
+                    browser = self._launch()
+                    if browser is None:
+                        raise PoolExhausted("Failed to launch browser")
+                    return browser
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted("No browser available")
+                try:
+                    browser = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    raise PoolExhausted("No browser available")
+
+            if self._is_healthy(browser):
+                return browser
+            print("[POOL] Idle browser failed health check, recycling.")
+            self._dispose(browser)
+
+    def release(self, browser):
+        browser.jobs += 1
+        reason = None
+        if self._closed:
+            reason = "pool closed"
+        elif browser.jobs >= self.max_jobs:
+            reason = f"served {browser.jobs} jobs"
+        else:
+            rss = process_tree_rss_mb(getattr(browser.driver, "browser_pid", None))
+            if self.max_rss_mb and rss > self.max_rss_mb:
+                reason = f"RSS {rss} MB > {self.max_rss_mb} MB"
+            elif not self._reset(browser):
+                reason = "reset failed"
+
+        if reason:
+            print(f"[POOL] Recycling browser: {reason}")
+            self._dispose(browser)
+            if not self._closed:
+                threading.Thread(target=self._replenish, daemon=True).start()
+        else:
+            self._idle.put(browser)
+
+    # --- Internals ---
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._live < self.size:
+                self._live += 1
+                return True
+            return False
+
+    def _launch(self):
+        # Launches are serialized: pyvirtualdisplay exports DISPLAY process-wide,
+        # so each Chrome must start right after its own display.
+        with self._launch_lock:
+            try:
+                driver, display = self.launcher()
+                return PooledBrowser(driver, display)
+            except Exception as e:
+                print(f"[POOL] Browser launch failed: {e}")
+                with self._lock:
+                    self._live -= 1
+                return None
+
+    def _replenish(self):
+        if self._closed or not self._reserve_slot():
+            return
+        browser = self._launch()
+        if browser:
+            self._idle.put(browser)
+
+    def _dispose(self, browser):
+        browser.quit()
+        with self._lock:
+            self._live -= 1
+
+    def _is_healthy(self, browser):
+        try:
+            return browser.driver.execute_script("return 1;") == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _visited_origins(driver):
+        """Origins the current tab has shown: its navigation history and the current page's frames."""
+        history = driver.execute_cdp_cmd("Page.getNavigationHistory", {})
+        urls = [entry.get("url") for entry in history.get("entries", [])]
+        frames = [driver.execute_cdp_cmd("Page.getFrameTree", {}).get("frameTree", {})]
+        while frames:
+            node = frames.pop()
+            urls.append(node.get("frame", {}).get("url"))
+            frames.extend(node.get("childFrames", []))
+        origins = set()
+        for url in urls:
+            parts = urllib.parse.urlsplit(url or "")
+            if parts.scheme in ("http", "https") and parts.netloc:
+                origins.add(f"{parts.scheme}://{parts.netloc}")
+        return origins
+
+    def _reset(self, browser):
+        """Closes extra tabs and wipes cookies/storage so the next lease starts clean."""
+        driver = browser.driver
+        try:
+            handles = driver.window_handles
+            # Storage can only be cleared per origin, so collect them before leaving the pages
+            origins = set()
+            for handle in reversed(handles):
+                driver.switch_to.window(handle)
+                origins |= self._visited_origins(driver)
+                if handle != handles[0]:
+                    driver.close()
+            driver.get("about:blank")
+            driver.delete_all_cookies()
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            for origin in origins:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            return True
+        except Exception as e:
+            print(f"[POOL] Reset error: {e}")
+            return False
@@ -0,0 +1,182 @@
+import os
+import re
+import hmac
+import json
+import base64
+import hashlib
+import secrets
+import tempfile
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+RELAY_ENABLED = os.environ.get("RELAY_ENABLED", "1") != "0"
+# Signing key for relay links; a random one means links die with the process
+RELAY_SECRET = os.environ.get("RELAY_SECRET") or secrets.token_hex(32)
+SEGMENT_CACHE_MEMORY = int(os.environ.get("RELAY_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+SEGMENT_CACHE_DISK = int(os.environ.get("RELAY_CACHE_DISK_BYTES", str(2 * 1024 * 1024 * 1024)))
+SEGMENT_CACHE_DIR = os.environ.get("RELAY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "fasel_segments"))
+# Larger objects are streamed through but never cached
+SEGMENT_CACHE_MAX_ITEM = int(os.environ.get("RELAY_CACHE_MAX_ITEM_BYTES", str(16 * 1024 * 1024)))
+# How long a viewer waits on another viewer's fetch of the same segment before fetching it itself
+SEGMENT_WAIT_TIMEOUT = float(os.environ.get("RELAY_SEGMENT_WAIT_TIMEOUT", "20"))
+
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+
+
+# --- Signed relay links ---
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def encode_headers(headers):
+    keep = {k: v for k, v in (headers or {}).items() if k in ("Referer", "User-Agent", "Origin", "Cookie")}
+    return _b64(json.dumps(keep, separators=(",", ":")).encode())
+
+
+def decode_headers(token):
+    return json.loads(_unb64(token))
+
+
+def sign(url, header_token):
+    mac = hmac.new(RELAY_SECRET.encode(), f"{url}\n{header_token}".encode(), hashlib.sha256)
+    return _b64(mac.digest()[:16])
+
+
+def verify(url, header_token, signature):
+    return hmac.compare_digest(sign(url, header_token), signature or "")
+
+
+def relay_link(base, kind, url, header_token):
+    """Builds a signed /relay/<kind> URL (kind is "playlist" or "segment")."""
+    query = urllib.parse.urlencode({"u": url, "h": header_token, "s": sign(url, header_token)})
+    return f"{base}/relay/{kind}?{query}"
+
+
+# --- Playlist rewriting ---
+
+def _is_playlist(url):
+    return ".m3u8" in urllib.parse.urlsplit(url).path
+
+
+def rewrite_playlist(text, playlist_url, base, header_token):
+    """
+    Rewrites every URI in a master or media playlist to point back at the
+    relay: nested playlists to /relay/playlist, segments and keys to /relay/segment.
+    """
+    out = []
+    next_is_playlist = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("#"):
+            if stripped.startswith("#EXT-X-STREAM-INF") or stripped.startswith("#EXT-X-I-FRAME-STREAM-INF"):
+                next_is_playlist = stripped.startswith("#EXT-X-STREAM-INF")
+            if 'URI="' in stripped:
+                def replace(match):
+                    absolute = urllib.parse.urljoin(playlist_url, match.group(1))
+                    kind = "playlist" if _is_playlist(absolute) else "segment"
+                    return f'URI="{relay_link(base, kind, absolute, header_token)}"'
+                stripped = re.sub(r'URI="([^"]+)"', replace, stripped)
+            out.append(stripped)
+        elif stripped:
+            absolute = urllib.parse.urljoin(playlist_url, stripped)
+            kind = "playlist" if next_is_playlist or _is_playlist(absolute) else "segment"
+            out.append(relay_link(base, kind, absolute, header_token))
+            next_is_playlist = False
+        else:
+            out.append(line)
+    return "\n".join(out) + "\n"
+
+
+# --- Segment cache ---
+
+class SegmentCache:
+    """
+    Byte-bounded LRU for relayed segments. Hot entries live in memory;
+    entries evicted from memory spill to disk, which has its own byte budget.
+    """
+    def __init__(self, memory_bytes=SEGMENT_CACHE_MEMORY, disk_bytes=SEGMENT_CACHE_DISK, directory=SEGMENT_CACHE_DIR):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self._memory = OrderedDict()   # key -> (bytes, content_type)
+        self._disk = OrderedDict()     # key -> (path, size, content_type)
+        self._memory_used = 0
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_bytes:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def get(self, key):
+        """Returns ("memory", bytes, content_type), ("disk", path, content_type) or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                data, content_type = self._memory[key]
+                return "memory", data, content_type
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                path, _, content_type = self._disk[key]
+                if os.path.exists(path):
+                    self.hits += 1
+                    return "disk", path, content_type
+                self._drop_disk(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, data, content_type):
+        size = len(data)
+        if size > SEGMENT_CACHE_MAX_ITEM or size > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = (data, content_type)
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes and self._memory:
+                old_key, (old_data, old_type) = self._memory.popitem(last=False)
+                self._memory_used -= len(old_data)
+                self._spill(old_key, old_data, old_type)
+
+    def _spill(self, key, data, content_type):
+        if not self.disk_bytes or key in self._disk:
+            return
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            print(f"[RELAY] Segment spill failed: {e}")
+            return
+        self._disk[key] = (path, len(data), content_type)
+        self._disk_used += len(data)
+        while self._disk_used > self.disk_bytes and self._disk:
+            self._drop_disk(next(iter(self._disk)))
+
+    def _drop_disk(self, key):
+        path, size, _ = self._disk.pop(key)
+        self._disk_used -= size
+        try: os.remove(path)
+        except OSError: pass
+
+    def stats(self):
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_used,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_used,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
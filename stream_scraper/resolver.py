@@ -0,0 +1,70 @@
+import os
+
+try:
+    from stream_scraper.http_resolver import resolve_stream_http, EscalateToBrowser
+    from stream_scraper.scraper import scrape_stream_app_mode
+    from stream_scraper.fleet import get_worker_fleet
+    from stream_scraper.jobs import Preempted
+    from stream_scraper.metrics import trace_scrape, span
+    from stream_scraper import mirrors
+except ImportError:
+    from http_resolver import resolve_stream_http, EscalateToBrowser
+    from scraper import scrape_stream_app_mode
+    from fleet import get_worker_fleet
+    from jobs import Preempted
+    from metrics import trace_scrape, span
+    import mirrors
+
+# Set SCRAPER_HTTP_TIER=0 to always go straight to the browser
+HTTP_TIER_ENABLED = os.environ.get("SCRAPER_HTTP_TIER", "1") != "0"
+
+
+def resolve_stream(target_url, cancel=None):
+    """
+    Tiered stream resolver. Tries the browserless HTTP path first and
+    escalates to Chrome only when it fails. The result carries a "tier"
+    key ("http" or "browser") telling which tier answered.
+
+    The browser tier runs in a fleet worker process when SCRAPER_WORKERS > 0.
+    An episode page on a mirror that does not answer is retried on the next
+    mirror, and the browser is sent to whichever mirror is current.
+
+    `cancel` (a threading.Event) is set by the scheduler when background
+    work must yield: the browser tier is then skipped, or stopped at its
+    next phase, with Preempted.
+    """
+    with trace_scrape(target_url) as trace:
+        if HTTP_TIER_ENABLED:
+            try:
+                with span("http_tier"):
+                    result = mirrors.fetch_on_mirror(target_url, resolve_stream_http)
+                print("[RESOLVER] Answered by HTTP tier")
+                result["tier"] = "http"
+                trace.update(tier="http", player_path="http", extraction="source", result=result)
+                return result
+            except EscalateToBrowser as e:
+                print(f"[RESOLVER] Escalating to browser: {e}")
+            except Exception as e:
+                print(f"[RESOLVER] HTTP tier error, escalating to browser: {e}")
+
+        if cancel is not None and cancel.is_set():
+            trace["outcome"] = "preempted"
+            raise Preempted(f"Preempted before browser tier: {target_url}")
+
+        trace["tier"] = "browser"
+        target_url = mirrors.rewrite(target_url)
+        fleet = get_worker_fleet()
+        try:
+            if fleet:
+                result = fleet.run(target_url, cancel=cancel)
+                if result and result.pop("preempted", False):
+                    raise Preempted(result["error"])
+            else:
+                result = scrape_stream_app_mode(target_url, cancel=cancel)
+        except Preempted:
+            trace["outcome"] = "preempted"
+            raise
+        if result is not None:
+            result["tier"] = "browser"
+        trace["result"] = result
+        return result
@@ -3,11 +3,9 @@ import stat
 import shutil
 import time
 import sys
-import re
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import threading
+# undetected_chromedriver and selenium are imported where a browser is used:
+# they add ~0.4 s to every import of this module, paid even by the HTTP tier
 
 # Optional: for running "visible" mode in headless environment
 try:
@@ -15,10 +13,43 @@ try:
 except ImportError:
     Display = None
 
+try:
+    from stream_scraper.pool import BrowserPool, PoolExhausted, POOL_SIZE
+    from stream_scraper.waits import (
+        wait_for_episode_page, wait_for_player_iframe, wait_for_m3u8,
+        wait_for_page_cleared, EPISODE_TIMEOUT, PLAYER_TIMEOUT
+    )
+    from stream_scraper.network import (
+        capture_enabled, add_capture_options, start_capture,
+        wait_for_playlist_request, get_header
+    )
+    from stream_scraper.metrics import span, annotate
+    from stream_scraper.http_resolver import find_player_urls, race_players, RACE_ENABLED, CHALLENGE_MARKERS
+    from stream_scraper.session import get_session_store, REFRESH_MARGIN
+    from stream_scraper.driver import prepared_driver, CHROME_VERSION
+    from stream_scraper.extract import extract_playlists, extract_server_markup, pick_master
+    from stream_scraper.jobs import Preempted
+except ImportError:
+    from pool import BrowserPool, PoolExhausted, POOL_SIZE
+    from waits import (
+        wait_for_episode_page, wait_for_player_iframe, wait_for_m3u8,
+        wait_for_page_cleared, EPISODE_TIMEOUT, PLAYER_TIMEOUT
+    )
+    from network import (
+        capture_enabled, add_capture_options, start_capture,
+        wait_for_playlist_request, get_header
+    )
+    from metrics import span, annotate
+    from http_resolver import find_player_urls, race_players, RACE_ENABLED, CHALLENGE_MARKERS
+    from session import get_session_store, REFRESH_MARGIN
+    from driver import prepared_driver, CHROME_VERSION
+    from extract import extract_playlists, extract_server_markup, pick_master
+    from jobs import Preempted
+
 def setup_local_driver():
     """
     Copies the system uc_driver to /tmp/uc_driver and makes it executable.
-    Returns the path to the new writable driver.
+    Returns the path to the new writable driver. An up-to-date copy is reused.
     """
     try:
         import seleniumbase
@@ -28,7 +59,11 @@ def setup_local_driver():
         local_target = "/tmp/uc_driver"
         
         if os.path.exists(system_driver_path):
+            source = os.stat(system_driver_path)
             if os.path.exists(local_target):
+                target = os.stat(local_target)
+                if target.st_size == source.st_size and target.st_mtime >= source.st_mtime:
+                    return local_target
                 try: os.remove(local_target)
                 except: pass
             
@@ -40,13 +75,15 @@ def setup_local_driver():
         print(f"Driver setup error: {e}")
     return None
 
-def scrape_stream_app_mode(target_url):
+def launch_browser():
     """
-    Scraper using raw undetected-chromedriver to bypass SeleniumBase permission issues.
+    Starts an Xvfb display (when available) and an undetected Chrome on it.
+    Returns (driver, display); display is None when not used.
     """
+    import undetected_chromedriver as uc
+
     driver = None
     display = None
-    
     try:
         is_linux = sys.platform.startswith("linux")
         print(f"[SCRAPER] Platform: {sys.platform}, is_linux: {is_linux}")
@@ -59,8 +96,9 @@ def scrape_stream_app_mode(target_url):
         #     # Start Xvfb if available (better than headless for detection)
         if is_linux and Display:
             print("[SCRAPER] Starting Xvfb display...")
-            display = Display(visible=0, size=(1280, 720))
-            display.start()
+            with span("xvfb_start"):
+                display = Display(visible=0, size=(1280, 720))
+                display.start()
             print("[SCRAPER] Xvfb started.")
 
         # 2. Initialize Chrome Options
@@ -75,135 +113,319 @@ def scrape_stream_app_mode(target_url):
         options.add_argument("--disable-gpu")
         options.add_argument("--disable-extensions")
         options.add_argument("--disable-software-rasterizer")
+        # Return from driver.get() at DOMContentLoaded; explicit waits handle the rest
+        options.page_load_strategy = "eager"
+        if capture_enabled():
+            add_capture_options(options)
         print("[SCRAPER] Chrome options configured.")
         
         # 3. Initialize Driver
-        print("[SCRAPER] Initializing ChromeDriver (version_main=144)... This may take time.")
-        # Force ChromeDriver version to match installed Chrome (144)
+        print(f"[SCRAPER] Initializing ChromeDriver (version_main={CHROME_VERSION})...")
+        # Force ChromeDriver version to match installed Chrome
         kwargs = {
             "options": options,
-            "version_main": 144  # Match the installed Chrome version on Render
+            "version_main": CHROME_VERSION  # Match the installed Chrome version on Render
         }
-            
-        driver = uc.Chrome(**kwargs)
+        # A driver patched at build time skips the download + patch on first launch
+        custom_driver_path = prepared_driver()
+        if custom_driver_path:
+            kwargs["driver_executable_path"] = custom_driver_path
+        else:
+            print("[SCRAPER] No pre-patched driver; downloading one. This may take time.")
+
+        with span("driver_init"):
+            driver = uc.Chrome(**kwargs)
         print("[SCRAPER] ChromeDriver initialized successfully!")
         
         # Set timeouts to prevent infinite hangs
         driver.set_page_load_timeout(30)  # 30 seconds max for page load
         driver.set_script_timeout(30)
         print("[SCRAPER] Timeouts set (30s)")
-        
+        return driver, display
+    except Exception:
+        if driver:
+            try: driver.quit()
+            except: pass
+        if display:
+            try: display.stop()
+            except: pass
+        raise
+
+def warm_browser():
+    """
+    Launches and closes one browser so the first real scrape finds the driver
+    patched and Chrome's files in the page cache. Returns the seconds it took.
+    """
+    started = time.perf_counter()
+    driver, display = launch_browser()
+    try: driver.quit()
+    except: pass
+    if display:
+        try: display.stop()
+        except: pass
+    return time.perf_counter() - started
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_browser_pool():
+    """
+    Returns the process-wide browser pool, or None when pooling is disabled
+    (SCRAPER_POOL_SIZE=0).
+    """
+    global _pool
+    if POOL_SIZE <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(launch_browser)
+        return _pool
+
+def scrape_stream_app_mode(target_url, pool=None, cancel=None):
+    """
+    Scraper using raw undetected-chromedriver to bypass SeleniumBase permission issues.
+    Leases a warm browser from `pool` (default: the process-wide pool) when
+    enabled, otherwise cold-starts one.
+    `cancel` (anything with is_set()) is checked between phases; once set
+    the scrape stops with Preempted.
+    """
+    return _with_driver(lambda driver, url: _scrape_with_driver(driver, url, cancel), target_url, pool)
+
+def refresh_session(url, pool=None):
+    """
+    Visits `url` in a browser to renew the site's stored session state
+    (clearance cookies, localStorage) before it expires.
+    """
+    return _with_driver(_refresh_session_with_driver, url, pool)
+
+def _with_driver(job, target_url, pool=None):
+    """Runs job(driver, target_url) on a pooled browser, or on a cold-started one without a pool."""
+    pool = pool or get_browser_pool()
+    if pool:
+        try:
+            with span("pool_lease"):
+                browser = pool.acquire()
+            try:
+                return job(browser.driver, target_url)
+            finally:
+                pool.release(browser)
+        except PoolExhausted as e:
+            return {"error": f"Browser pool busy: {e}"}
+
+    driver = None
+    display = None
+    try:
+        driver, display = launch_browser()
+        return job(driver, target_url)
+    except Preempted:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        # Cleanup
+        if driver:
+            try: driver.quit()
+            except: pass
+        if display:
+            try: display.stop()
+            except: pass
+
+def _refresh_session_with_driver(driver, url):
+    store = get_session_store()
+    if not store:
+        return {"error": "Session reuse disabled"}
+    handle = store.apply(driver, url, mark_used=False)
+    try:
+        with span("session_refresh"):
+            try:
+                driver.get(url)
+            except Exception as nav_error:
+                print(f"[SCRAPER] Navigation timeout/error: {nav_error}")
+            if not wait_for_page_cleared(driver, CHALLENGE_MARKERS):
+                return {"error": f"Challenge not cleared on {url}"}
+            store.capture(driver, url)
+        return {"url": url}
+    finally:
+        store.release(driver, handle)
+
+def _scrape_with_driver(driver, target_url, cancel=None):
+    """
+    Runs the episode -> player -> m3u8 flow on an already running driver.
+    Stored session state (cookies, localStorage) for the site is loaded first
+    and saved back once the episode page got through.
+    """
+    store = get_session_store()
+    handle = store.apply(driver, target_url) if store else None
+    try:
+        return _run_episode_flow(driver, target_url, store, cancel)
+    finally:
+        if store:
+            store.release(driver, handle)
+
+def _check_cancel(cancel, phase):
+    if cancel is not None and cancel.is_set():
+        print(f"[SCRAPER] Preempted {phase}")
+        raise Preempted(f"Preempted {phase}")
+
+def _run_episode_flow(driver, target_url, store, cancel=None):
+    try:
         # 4. Navigation & Logic
+        if capture_enabled():
+            start_capture(driver)
         print(f"[SCRAPER] Navigating to: {target_url}")
-        try:
-            driver.get(target_url)
-        except Exception as nav_error:
-            print(f"[SCRAPER] Navigation timeout/error: {nav_error}")
-            # Even if timeout, we might have partial page - continue
-            
-        print("[SCRAPER] Page loaded (or timed out), waiting 3 seconds...")
-        time.sleep(3)
+        with span("navigation"):
+            try:
+                driver.get(target_url)
+            except Exception as nav_error:
+                print(f"[SCRAPER] Navigation timeout/error: {nav_error}")
+                # Even if timeout, we might have partial page - continue
+        _check_cancel(cancel, "after episode navigation")
+
+        print(f"[SCRAPER] Page loaded (or timed out), waiting up to {EPISODE_TIMEOUT}s for player or servers...")
+        with span("iframe_discovery"):
+            state, player_url = wait_for_episode_page(driver)
         print(f"[SCRAPER] Current page title: {driver.title}")
+        print(f"[SCRAPER] Episode page state: {state}")
+        if state and store:
+            saved = store.get(target_url)
+            # Page got past any challenge: keep its state unless a fresh copy is already stored
+            if not saved or saved["expires"] - time.time() <= REFRESH_MARGIN:
+                store.capture(driver, target_url)
+        if player_url:
+            print(f"[SCRAPER] Got player_url from iframe: {player_url}")
+            annotate(player_path="iframe")
         
-        # Find player iframe
-        print("[SCRAPER] Looking for player iframe...")
-        player_url = None
-        try:
-            # Try finding by name first
-            print("[SCRAPER] Trying By.NAME='player_iframe'...")
-            frames = driver.find_elements(By.NAME, "player_iframe")
-            print(f"[SCRAPER] Found {len(frames)} frames by name")
-            if frames:
-                player_url = frames[0].get_attribute("src")
-                print(f"[SCRAPER] Got player_url from name: {player_url}")
-            else:
-                # Fallback: find any iframe with 'video_player'
-                print("[SCRAPER] Trying all iframes...")
-                frames = driver.find_elements(By.TAG_NAME, "iframe")
-                print(f"[SCRAPER] Found {len(frames)} total iframes")
-                for i, f in enumerate(frames):
-                    src = f.get_attribute("src")
-                    print(f"[SCRAPER] iframe[{i}] src: {src}")
-                    if src and "video_player" in src:
-                        player_url = src
-                        print(f"[SCRAPER] Found video_player iframe!")
-                        break
-        except Exception as e:
-            print(f"[SCRAPER] Error finding iframes: {e}")
-        
+        if not player_url and RACE_ENABLED:
+            # Race every server option over HTTP with the browser's cookies; first working master wins
+            with span("server_race"):
+                won = _race_servers(driver)
+            if won:
+                annotate(player_path="server-race", extraction="race")
+                player_url, master, headers = won
+                return _build_result(driver, master, player_url, headers)
+
         if not player_url:
             # Check for server buttons (common in Fasel)
             print("[SCRAPER] No player found, checking for server buttons...")
-            try:
-                servers = driver.find_elements(By.CSS_SELECTOR, ".server--item")
-                print(f"[SCRAPER] Found {len(servers)} server buttons")
-                if servers:
-                    print("[SCRAPER] Clicking first server button...")
-                    servers[0].click()
-                    time.sleep(2)
-                    # Re-check iframes
-                    frames = driver.find_elements(By.TAG_NAME, "iframe")
-                    print(f"[SCRAPER] After click, found {len(frames)} iframes")
-                    for f in frames:
-                        src = f.get_attribute("src")
-                        if src and "video_player" in src:
-                            player_url = src
+            annotate(player_path="server-button")
+            with span("server_fallback"):
+                try:
+                    from selenium.webdriver.common.by import By
+                    servers = driver.find_elements(By.CSS_SELECTOR, ".server--item")
+                    print(f"[SCRAPER] Found {len(servers)} server buttons")
+                    for i, server in enumerate(servers):
+                        print(f"[SCRAPER] Clicking server button {i + 1}...")
+                        server.click()
+                        player_url = wait_for_player_iframe(driver)
+                        if player_url:
                             print(f"[SCRAPER] Found player after click: {player_url}")
                             break
-            except Exception as e:
-                print(f"[SCRAPER] Error with server buttons: {e}")
+                except Exception as e:
+                    print(f"[SCRAPER] Error with server buttons: {e}")
             
         if not player_url:
             print("[SCRAPER] FAILED: No player found anywhere")
             return {"error": f"Player not found. Title: {driver.title}"}
         
         print(f"[SCRAPER] SUCCESS: Player URL = {player_url}")
-            
+        _check_cancel(cancel, "before player page")
+
         # 5. Extract M3U8 from Player
-        print(f"[SCRAPER] Navigating to player: {player_url}")
-        try:
-            driver.get(player_url)
-        except Exception as nav_err:
-            print(f"[SCRAPER] Player navigation error: {nav_err}")
-            
-        print("[SCRAPER] Player loaded, waiting 3 seconds...")
-        time.sleep(3)
-        source = driver.page_source
-        print(f"[SCRAPER] Got page source, length: {len(source)}")
-        
-        print("[SCRAPER] Searching for m3u8 URLs...")
-        matches = re.findall(r'(https?://[^"\s\']+\.m3u8[^"\s\']*)', source)
+        if capture_enabled():
+            # Forget episode-page traffic so only the player's requests are considered
+            start_capture(driver)
+        print(f"[SCRAPER] Navigating to: {player_url}")
+        with span("player_navigation"):
+            try:
+                driver.get(player_url)
+            except Exception as nav_err:
+                print(f"[SCRAPER] Player navigation error: {nav_err}")
+        _check_cancel(cancel, "before m3u8 extraction")
+
+        if capture_enabled():
+            print(f"[SCRAPER] Player loading, capturing m3u8 request (up to {PLAYER_TIMEOUT}s)...")
+            with span("m3u8_capture"):
+                captured = wait_for_playlist_request(driver, PLAYER_TIMEOUT)
+            if captured:
+                print(f"[SCRAPER] Captured m3u8 request: {captured['url']}")
+                annotate(extraction="network")
+                return _build_result(driver, captured["url"], player_url, captured["headers"])
+            print("[SCRAPER] No m3u8 request captured, falling back to page source")
+        else:
+            print(f"[SCRAPER] Player loaded, waiting up to {PLAYER_TIMEOUT}s for m3u8...")
+            with span("m3u8_wait"):
+                found = wait_for_m3u8(driver)
+            if not found:
+                print("[SCRAPER] m3u8 did not appear before timeout, scanning anyway")
+        annotate(extraction="source")
+        with span("m3u8_extraction"):
+            # Searched inside the page: only the matches come back, not the DOM
+            print("[SCRAPER] Searching for m3u8 URLs...")
+            matches, user_agent = extract_playlists(driver)
         print(f"[SCRAPER] Found {len(matches)} m3u8 URLs")
         if matches:
-            master = next((m for m in matches if "master" in m), matches[0])
+            master = pick_master(matches)
             print(f"[SCRAPER] Selected m3u8: {master}")
-            headers = {
-                "Referer": player_url,
-                "User-Agent": driver.execute_script("return navigator.userAgent;")
-            }
-            curl_cmd = f"curl '{master}' -H 'Referer: {player_url}' -H 'User-Agent: {headers['User-Agent']}'"
-            
-            print("[SCRAPER] SUCCESS! Returning result.")
-            return {
-                "url": master,
-                "headers": headers,
-                "curl": curl_cmd
-            }
+            return _build_result(driver, master, player_url, user_agent=user_agent)
         else:
             return {"error": f"No M3U8 found. Player: {player_url}"}
 
+    except Preempted:
+        raise
     except Exception as e:
         return {"error": str(e)}
-        
-    finally:
-        # Cleanup
-        if driver:
-            try: driver.quit()
-            except: pass
-        if display:
-            try: display.stop()
-            except: pass
+
+def _race_servers(driver):
+    """
+    Lists every server option on the episode page and races their players
+    over HTTP with the browser's User-Agent. Cookies are not copied from the
+    browser: player hosts and CDNs are other sites, and each request only
+    gets the stored session cookies whose domain matches its host.
+    Returns (player_url, master_url, headers used) or None.
+    """
+    try:
+        markup, page_url, user_agent = extract_server_markup(driver)
+        candidates = find_player_urls(markup, page_url)
+        if not candidates:
+            return None
+        print(f"[SCRAPER] Racing {len(candidates)} server(s)...")
+        headers = {"User-Agent": user_agent}
+        won = race_players(candidates, dict(headers, Referer=page_url))
+        return won + (headers,) if won else None
+    except Exception as e:
+        print(f"[SCRAPER] Server race error: {e}")
+        return None
+
+def _build_result(driver, master, player_url, captured_headers=None, user_agent=None):
+    """
+    Builds the {"url", "headers", "curl"} response. Captured request headers
+    take precedence; Referer and User-Agent are always present.
+    """
+    captured_headers = captured_headers or {}
+    user_agent = get_header(captured_headers, "User-Agent") or user_agent
+    if not user_agent:
+        user_agent = driver.execute_script("return navigator.userAgent;")
+    headers = {
+        "Referer": get_header(captured_headers, "Referer") or player_url,
+        "User-Agent": user_agent
+    }
+    for name in ("Origin", "Cookie"):
+        value = get_header(captured_headers, name)
+        if value:
+            headers[name] = value
+
+    curl_cmd = f"curl '{master}'" + "".join(f" -H '{k}: {v}'" for k, v in headers.items())
+    print("[SCRAPER] SUCCESS! Returning result.")
+    return {
+        "url": master,
+        "headers": headers,
+        "curl": curl_cmd
+    }
 
 if __name__ == "__main__":
-    url = "https://web12818x.faselhdx.bid/asian_seasons/مسلسل-squid-game" 
+    try:
+        from stream_scraper.mirrors import current_base
+    except ImportError:
+        from mirrors import current_base
+    url = current_base() + "/asian_seasons/مسلسل-squid-game"
     print(scrape_stream_app_mode(url))
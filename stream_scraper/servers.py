@@ -0,0 +1,104 @@
+import os
+import time
+import sqlite3
+import threading
+import urllib.parse
+
+try:
+    from stream_scraper import metrics
+except ImportError:
+    import metrics
+
+STATS_PATH = os.environ.get("SCRAPER_SERVER_STATS_PATH", "/tmp/fasel_servers.sqlite")
+# Weight of the newest sample in the latency moving average
+EWMA_ALPHA = 0.3
+# Assumed latency of a server never seen before, so it ranks mid-field
+PRIOR_SECONDS = 3.0
+
+SERVER_SECONDS = metrics.Histogram("scraper_server_seconds", "Time for a player server to yield a valid master playlist.", ["server"])
+SERVER_RESULTS = metrics.Counter("scraper_server_results_total", "Player server race results.", ["server", "result"])
+
+
+def server_key(player_url):
+    """Identifies a player server: its host, plus the `server` parameter when several share a host."""
+    parts = urllib.parse.urlsplit(player_url)
+    params = dict(urllib.parse.parse_qsl(parts.query))
+    key = parts.netloc.lower()
+    if params.get("server"):
+        key += f"#{params['server']}"
+    return key
+
+
+class ServerStats:
+    """
+    Per-server success counts and latency (moving average) kept in SQLite so
+    they survive restarts and are shared by fleet workers.
+    """
+    def __init__(self, path=STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS servers ("
+            " key TEXT PRIMARY KEY, attempts INTEGER NOT NULL, successes INTEGER NOT NULL,"
+            " ewma_seconds REAL, updated REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def record(self, key, ok, seconds=None):
+        with self._lock:
+            row = self._db.execute("SELECT attempts, successes, ewma_seconds FROM servers WHERE key = ?", (key,)).fetchone()
+            attempts, successes, ewma = row or (0, 0, None)
+            if ok:
+                successes += 1
+                ewma = seconds if ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * ewma
+            self._db.execute(
+                "INSERT OR REPLACE INTO servers VALUES (?, ?, ?, ?, ?)",
+                (key, attempts + 1, successes, ewma, time.time())
+            )
+            self._db.commit()
+
+    def expected_seconds(self, key):
+        """Latency divided by success rate: the expected wait for a working playlist."""
+        with self._lock:
+            row = self._db.execute("SELECT attempts, successes, ewma_seconds FROM servers WHERE key = ?", (key,)).fetchone()
+        if not row or not row[0]:
+            return PRIOR_SECONDS
+        attempts, successes, ewma = row
+        # Laplace smoothing keeps one early failure from burying a server forever
+        rate = (successes + 1) / (attempts + 2)
+        return (ewma or PRIOR_SECONDS) / rate
+
+    def rank(self, player_urls):
+        """Orders candidate player URLs, historically fastest and most reliable first."""
+        return sorted(player_urls, key=lambda url: self.expected_seconds(server_key(url)))
+
+    def snapshot(self):
+        with self._lock:
+            rows = self._db.execute("SELECT key, attempts, successes, ewma_seconds FROM servers ORDER BY key").fetchall()
+        return [{"server": k, "attempts": a, "successes": s, "ewma_seconds": e} for k, a, s, e in rows]
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_server_stats():
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = ServerStats()
+        return _stats
+
+
+def record_attempt(player_url, ok, seconds=None, cancelled=False):
+    """Counts one race attempt in the metrics and, unless cancelled, in the persisted stats."""
+    key = server_key(player_url)
+    if cancelled:
+        SERVER_RESULTS.inc(server=key, result="cancelled")
+        return
+    SERVER_RESULTS.inc(server=key, result="ok" if ok else "failed")
+    if ok:
+        SERVER_SECONDS.observe(seconds, server=key)
+    get_server_stats().record(key, ok, seconds)
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import threading
+import urllib.parse
+
+SESSION_ENABLED = os.environ.get("SCRAPER_SESSION_REUSE", "1") != "0"
+SESSION_PATH = os.environ.get("SCRAPER_SESSION_PATH", "/tmp/fasel_session.json")
+# Lifetime of a state without cookie expiries (session cookies only)
+SESSION_TTL = int(os.environ.get("SCRAPER_SESSION_TTL", "1800"))
+# Refresh a site's state this long before it expires
+REFRESH_MARGIN = int(os.environ.get("SCRAPER_SESSION_REFRESH_MARGIN", "300"))
+REFRESH_CHECK_INTERVAL = 60
+# Longest wait before retrying a site whose refreshes keep failing
+REFRESH_MAX_BACKOFF = 3600
+
+# Cookies set by anti-bot challenges; their expiry bounds the whole state's validity
+CLEARANCE_COOKIES = ("cf_clearance", "__cf_bm", "__ddg1_", "__ddg2_", "__ddgid_", "__ddgmark_")
+
+
+def _host(url):
+    return (urllib.parse.urlsplit(url).hostname or "").lower()
+
+
+def _domain_matches(host, cookie_domain):
+    domain = (cookie_domain or "").lstrip(".").lower()
+    return bool(domain) and (host == domain or host.endswith("." + domain))
+
+
+class SessionStore:
+    """
+    Browser session state per site host: cookies (all domains, via CDP), the
+    site's localStorage and the exact User-Agent of the Chrome that earned
+    them, with the time the state stops being valid.
+
+    Kept in a JSON file so API, fleet workers and the UI share one state.
+    """
+    def __init__(self, path=SESSION_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cached = (None, {})
+        # Per process: when each host's state was last used by a request, and
+        # (failures, next attempt) for origins whose refresh failed
+        self._used = {}
+        self._backoff = {}
+
+    # --- Storage ---
+
+    def _read(self):
+        # Re-parsed only when the file changes: HTTP requests consult it on every call
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return {}
+        version = (stat.st_mtime_ns, stat.st_size)
+        if self._cached[0] == version:
+            return self._cached[1]
+        try:
+            with open(self.path) as f:
+                states = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        self._cached = (version, states)
+        return states
+
+    def _write(self, states):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(states, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[SESSION] Could not save state: {e}")
+
+    def get(self, url, fresh_only=True):
+        """Stored state for the URL's host, or None (also when expired and fresh_only)."""
+        state = self._read().get(_host(url))
+        if not state:
+            return None
+        if fresh_only and state.get("expires", 0) <= time.time():
+            return None
+        return state
+
+    def hosts(self):
+        return self._read()
+
+    # --- Browser side ---
+
+    def capture(self, driver, url):
+        """Saves the browser's cookies, the page's localStorage and its User-Agent for url's host."""
+        try:
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+            storage = driver.execute_script(
+                "var o = {}; for (var i = 0; i < localStorage.length; i++) {"
+                " var k = localStorage.key(i); o[k] = localStorage.getItem(k); } return o;"
+            ) or {}
+            user_agent = driver.execute_script("return navigator.userAgent;")
+        except Exception as e:
+            print(f"[SESSION] Capture failed: {e}")
+            return None
+
+        now = time.time()
+        expiries = [c["expires"] for c in cookies
+                    if c.get("name") in CLEARANCE_COOKIES and c.get("expires", -1) > now]
+        state = {
+            "user_agent": user_agent,
+            "cookies": cookies,
+            "local_storage": storage,
+            "origin": f"{urllib.parse.urlsplit(url).scheme}://{urllib.parse.urlsplit(url).netloc}",
+            "saved": now,
+            "expires": min(expiries) if expiries else now + SESSION_TTL,
+        }
+        with self._lock:
+            states = dict(self._read())
+            states[_host(url)] = state
+            self._write(states)
+        print(f"[SESSION] Saved {len(cookies)} cookie(s) for {_host(url)}, valid {state['expires'] - now:.0f}s")
+        return state
+
+    def apply(self, driver, url, mark_used=True):
+        """
+        Loads the stored state for url's host into a browser before it
+        navigates there. Returns a handle for release() (or None).
+        Refreshes pass mark_used=False so they do not keep a site alive.
+        """
+        state = self.get(url)
+        if not state:
+            return None
+        if mark_used:
+            self._used[_host(url)] = time.time()
+        now = time.time()
+        cookies = []
+        for c in state["cookies"]:
+            if not c.get("session") and c.get("expires", -1) <= now:
+                continue
+            cookie = {k: c[k] for k in ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite")
+                      if c.get(k) is not None}
+            if not c.get("session"):
+                cookie["expires"] = c["expires"]
+            cookies.append(cookie)
+        script_id = None
+        try:
+            if cookies:
+                driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+            if state.get("local_storage"):
+                source = (
+                    f"if (location.origin === {json.dumps(state['origin'])}) {{"
+                    f" var s = {json.dumps(state['local_storage'])};"
+                    " for (var k in s) { try { localStorage.setItem(k, s[k]); } catch (e) {} } }"
+                )
+                script_id = driver.execute_cdp_cmd(
+                    "Page.addScriptToEvaluateOnNewDocument", {"source": source}
+                ).get("identifier")
+        except Exception as e:
+            print(f"[SESSION] Could not apply stored state: {e}")
+        return script_id
+
+    def release(self, driver, handle):
+        """Removes the localStorage seeding script installed by apply()."""
+        if handle:
+            try:
+                driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": handle})
+            except Exception:
+                pass
+
+    # --- HTTP side ---
+
+    def request_headers(self, url, headers=None):
+        """
+        Adds the stored Cookie and User-Agent for url's host to request headers.
+        Callers that already send their own Cookie are left alone.
+        """
+        headers = dict(headers or {})
+        if any(k.lower() == "cookie" for k in headers):
+            return headers
+        state = self.get(url)
+        if not state:
+            return headers
+        host = _host(url)
+        now = time.time()
+        self._used[host] = now
+        pairs = [f"{c['name']}={c['value']}" for c in state["cookies"]
+                 if _domain_matches(host, c.get("domain"))
+                 and (c.get("session") or c.get("expires", -1) > now)]
+        if pairs:
+            headers = {k: v for k, v in headers.items() if k.lower() != "user-agent"}
+            # Clearance cookies are bound to the User-Agent that earned them
+            headers["User-Agent"] = state["user_agent"]
+            headers["Cookie"] = "; ".join(pairs)
+        return headers
+
+    # --- Refresh ---
+
+    def due_for_refresh(self, margin=REFRESH_MARGIN):
+        """
+        Origins whose state expires within `margin` seconds, limited to states
+        holding clearance cookies that a request of this process used within
+        SESSION_TTL. Origins whose last refresh failed wait out their back-off.
+        """
+        now = time.time()
+        due = []
+        for host, state in self.hosts().items():
+            if not any(c.get("name") in CLEARANCE_COOKIES for c in state.get("cookies", [])):
+                continue
+            if now - self._used.get(host, 0) > SESSION_TTL:
+                continue
+            if state.get("expires", 0) - now > margin:
+                continue
+            if self._backoff.get(state["origin"], (0, 0))[1] > now:
+                continue
+            due.append(state["origin"])
+        return due
+
+    def _refresh_failed(self, origin, error):
+        failures = self._backoff.get(origin, (0, 0))[0] + 1
+        delay = min(REFRESH_CHECK_INTERVAL * 2 ** failures, REFRESH_MAX_BACKOFF)
+        self._backoff[origin] = (failures, time.time() + delay)
+        print(f"[SESSION] Refresh failed for {origin}: {error} (next try in {delay}s)")
+
+    def start_refresher(self, refresh, interval=REFRESH_CHECK_INTERVAL):
+        """
+        Calls refresh(origin_url) in a daemon thread for every site due for
+        refresh, so clearance is renewed before requests need it. refresh()
+        returns the job's result ({"error": ...} on failure), or None when it
+        could not run right now; it is then retried on the next check.
+        """
+        def loop():
+            while True:
+                time.sleep(interval)
+                for origin in self.due_for_refresh():
+                    print(f"[SESSION] Refreshing state for {origin}")
+                    try:
+                        result = refresh(origin + "/")
+                    except Exception as e:
+                        result = {"error": str(e)}
+                    if result is None:
+                        continue
+                    if "error" in result:
+                        self._refresh_failed(origin, result["error"])
+                    else:
+                        self._backoff.pop(origin, None)
+
+        threading.Thread(target=loop, name="session-refresh", daemon=True).start()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Process-wide store, or None when reuse is disabled (SCRAPER_SESSION_REUSE=0)."""
+    global _store
+    if not SESSION_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
+
+
+def request_headers(url, headers=None):
+    store = get_session_store()
+    return store.request_headers(url, headers) if store else dict(headers or {})
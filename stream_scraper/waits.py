@@ -0,0 +1,86 @@
+import os
+# Selenium is imported inside the waits: only browser jobs pay for it
+
+# Per-phase ceilings in seconds (overridable from the environment)
+EPISODE_TIMEOUT = float(os.environ.get("SCRAPER_WAIT_EPISODE", "10"))
+SERVER_TIMEOUT = float(os.environ.get("SCRAPER_WAIT_SERVER", "8"))
+PLAYER_TIMEOUT = float(os.environ.get("SCRAPER_WAIT_PLAYER", "10"))
+POLL_INTERVAL = float(os.environ.get("SCRAPER_WAIT_POLL", "0.2"))
+
+# Matches the m3u8 regex used on the player page, evaluated inside the browser
+_M3U8_PROBE_JS = r"""
+var html = document.documentElement ? document.documentElement.outerHTML : "";
+return /https?:\/\/[^"\s']+\.m3u8/.test(html);
+"""
+
+# Challenge check run in the page, so polling never copies the DOM into Python
+_CLEARED_JS = r"""
+if (document.readyState !== "complete") return false;
+var html = document.documentElement ? document.documentElement.outerHTML : "";
+return !arguments[0].some(function (m) { return html.indexOf(m) !== -1; });
+"""
+
+
+def _player_src(driver):
+    """Returns the player iframe src if present in the DOM, else None."""
+    from selenium.webdriver.common.by import By
+    frames = driver.find_elements(By.NAME, "player_iframe")
+    for f in frames:
+        src = f.get_attribute("src")
+        if src:
+            return src
+    for f in driver.find_elements(By.TAG_NAME, "iframe"):
+        src = f.get_attribute("src")
+        if src and "video_player" in src:
+            return src
+    return None
+
+
+def _until(driver, condition, timeout):
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
+    try:
+        return WebDriverWait(
+            driver, timeout, poll_frequency=POLL_INTERVAL,
+            ignored_exceptions=(StaleElementReferenceException,)
+        ).until(condition)
+    except TimeoutException:
+        return None
+
+
+def wait_for_episode_page(driver, timeout=EPISODE_TIMEOUT):
+    """
+    Waits until the episode page exposes either the player iframe or the
+    server buttons. Returns ("player", src), ("servers", None) or (None, None)
+    on timeout.
+    """
+    from selenium.webdriver.common.by import By
+
+    def ready(d):
+        src = _player_src(d)
+        if src:
+            return ("player", src)
+        if d.find_elements(By.CSS_SELECTOR, ".server--item"):
+            return ("servers", None)
+        return False
+
+    return _until(driver, ready, timeout) or (None, None)
+
+
+def wait_for_player_iframe(driver, timeout=SERVER_TIMEOUT):
+    """Waits for a player iframe to appear (e.g. after clicking a server). Returns its src or None."""
+    return _until(driver, lambda d: _player_src(d) or False, timeout)
+
+
+def wait_for_m3u8(driver, timeout=PLAYER_TIMEOUT):
+    """Waits until the player page markup contains an m3u8 URL. Returns True/False."""
+    return bool(_until(driver, lambda d: d.execute_script(_M3U8_PROBE_JS), timeout))
+
+
+def wait_for_page_cleared(driver, markers, timeout=EPISODE_TIMEOUT):
+    """
+    Waits until the page has loaded and none of the anti-bot challenge
+    `markers` remain in its markup. Returns True/False.
+    """
+    markers = list(markers)
+    return bool(_until(driver, lambda d: d.execute_script(_CLEARED_JS, markers), timeout))